@@ -1,25 +1,34 @@
 import json
 import os
+import shlex
+import threading
 import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from urllib.parse import urljoin
 
 import redis
 import requests
 import yaml
+from rq import get_current_job
 
 from actions.yaml_validation import Validator
-from deployment.container import Container
+from deployment.cache import DependencyCache
+from deployment.container import Container, reaper
 from kubernetes.client import V1EnvVar
 from models.initial_config import InitialConfig
 from models.run_config import RunConfig
 from models.scheduler_run import SchedulerRun
 from models.trigger_run import TriggerModel, TriggerRun
+from packages.vcs.mirror import RepoMirror
 from packages.vcs.vcs import VCSFactory
+from utils.live_logs import LiveLogs
+from utils.log_archive import LogArchive
 from utils.reporter import Reporter
+from utils.run_control import RunControl
+from utils.storage import Storage, record_neph_keys
 from utils.utils import Utils
 
-container = Container()
 reporter = Reporter()
 utils = Utils()
 r = redis.Redis()
@@ -28,9 +37,13 @@ SUCCESS = "success"
 FAILURE = "failure"
 ERROR = "error"
 PENDING = "pending"
+PARALLEL_JOBS = 3
 LOG_TYPE = "log"
 TESTSUITE_TYPE = "testsuite"
 NEPH_TYPE = "neph"
+BUNDLE_REMOTE_PATH = "/tmp/zeroci.bundle"
+# finished runs searched for the durations of a sharded step.
+DURATIONS_RUNS = 20
 
 
 class Actions(Validator):
@@ -38,26 +51,52 @@ class Actions(Validator):
     _BIN_DIR = "/zeroci/bin/"
     run_id = None
     model_obj = None
+    control = None
+    _lock = threading.Lock()
 
-    def test_run(self, job):
+    def _add_result(self, result):
+        """Store a step result of the run, jobs may run in parallel threads.
+        """
+        with self._lock:
+            self.model_obj.results.append(result)
+
+    def _status(self, container, failed, status=FAILURE):
+        """Get a step's status, it is the stop reason if the job has been cancelled or timed out.
+        """
+        if container.control and container.control.reason:
+            return container.control.reason
+        return status if failed else SUCCESS
+
+    def test_run(self, job, container, log_id, clone_details, job_number, cache=None):
         """Runs tests and store the result in DB.
+
+        :param cache: the job's dependency cache, the report of its restore on the shards' containers is added to it.
+        :type cache: DependencyCache
         """
         for line in job["script"]:
             if line.get("type") == "neph":
-                finished = self.neph_run(job_name=job["name"], line=line)
+                finished = self.neph_run(job_name=job["name"], line=line, container=container, log_id=log_id)
+            elif line.get("parallelism", 1) > 1:
+                finished = self.sharded_run(
+                    job=job,
+                    line=line,
+                    container=container,
+                    log_id=log_id,
+                    clone_details=clone_details,
+                    job_number=job_number,
+                    cache=cache,
+                )
             else:
-                finished = self.normal_run(job_name=job["name"], line=line)
+                finished = self.normal_run(job_name=job["name"], line=line, container=container, log_id=log_id)
             if not finished:
                 return False
         return True
 
-    def normal_run(self, job_name, line):
-        status = SUCCESS
-        response, file_path = container.run_test(id=self.run_id, run_cmd=line["cmd"])
+    def normal_run(self, job_name, line, container, log_id):
+        response, file_path = container.run_test(id=log_id, run_cmd=line["cmd"])
         result = response.stdout
         type = LOG_TYPE
-        if response.returncode:
-            status = FAILURE
+        status = self._status(container, failed=response.returncode)
         if file_path:
             try:
                 result = utils.xml_parse(path=file_path, line=line["cmd"])
@@ -67,61 +106,201 @@ class Actions(Validator):
             os.remove(file_path)
 
         name = "{job_name}: {test_name}".format(job_name=job_name, test_name=line["name"])
-        self.model_obj.result.append({"type": type, "status": status, "name": name, "content": result})
-        self.model_obj.save()
+        self._add_result({"type": type, "status": status, "name": name, "content": result})
         if response.returncode in [137, 124]:
             return False
         return True
 
-    def neph_run(self, job_name, line):
+    def _tests_durations(self, name):
+        """Get testcases durations of a step from the last finished run of the same branch or schedule.
+
+        :param name: step name in the result.
+        :type name: str
+        :return: {test id: duration in seconds}
+        :return type: dict
+        """
+        if isinstance(self.model_obj, TriggerModel):
+            where = {"repo": self.model_obj.repo, "branch": self.model_obj.branch}
+            factory = TriggerRun
+        else:
+            where = {"schedule_name": self.model_obj.schedule_name}
+            factory = SchedulerRun
+        where["status"] = [SUCCESS, FAILURE]
+        cursor = None
+        for _ in range(0, DURATIONS_RUNS, 5):
+            # runs are loaded a few at a time, the step is usually found in the last one.
+            cursor, runs = factory.latest(fields=["status"], limit=5, cursor=cursor, **where)
+            for run in runs:
+                run_obj = factory.get(id=run["id"])
+                if not run_obj:
+                    continue
+                for result in run_obj.results:
+                    if result["name"] == name and result["type"] == TESTSUITE_TYPE:
+                        durations = {}
+                        for testcase in result["content"]["testcases"]:
+                            test_id = f"{testcase.get('classname')}.{testcase.get('name')}"
+                            durations[test_id] = float(testcase.get("time") or 0)
+                        return durations
+            if not cursor:
+                break
+        return {}
+
+    def _collect_tests(self, line, container):
+        """Get the ids of the step's tests by running its `collect` command.
+
+        :return: test ids or None if they couldn't be listed.
+        """
+        if not line.get("collect"):
+            return None
+        response = container.execute_command(line["collect"], id="", verbose=False)
+        if response.returncode:
+            return None
+        tests = [test_id.strip() for test_id in response.stdout.splitlines() if test_id.strip()]
+        return list(dict.fromkeys(tests)) or None
+
+    def sharded_run(self, job, line, container, log_id, clone_details, job_number, cache=None):
+        """Split a test step over `parallelism` containers using the testcases durations of the last run.
+
+        The first shard runs on the job's container and every other shard gets a new container. Each shard gets
+        `ZEROCI_SHARD_INDEX`, `ZEROCI_SHARD_TOTAL` and its test ids in `ZEROCI_SHARD_TESTS` (one per line). If the
+        tests can't be listed by the step's `collect` command, one shard runs all of them with no test ids. The shards
+        that fail to be built are listed in the step's output.
+        """
+        name = "{job_name}: {test_name}".format(job_name=job["name"], test_name=line["name"])
+        tests = self._collect_tests(line=line, container=container)
+        if tests:
+            # a shard without tests would run all of them.
+            total = min(line["parallelism"], len(tests))
+            shards = utils.split_tests(tests=tests, durations=self._tests_durations(name), shards=total)
+        else:
+            total = 1
+            shards = [[]]
+            LiveLogs(log_id).write(f"\nCouldn't list the tests of {line['name']}, they will run on one container\n")
+
+        def run_shard(index):
+            shard_container = container
+            # every shard's lines are tagged, so they aren't mixed in the logs.
+            shard_log_id = f"{log_id}:shard{index}"
+            if index:
+                shard_container = Container(run_id=self.run_id, control=container.control)
+                shard_cache = self._job_cache(job=job, clone_details=clone_details)
+                deployed, installed = self.build(
+                    job=job,
+                    clone_details=clone_details,
+                    job_number=job_number,
+                    container=shard_container,
+                    log_id=shard_log_id,
+                    cache=shard_cache,
+                )
+                if cache and shard_cache:
+                    cache.report.extend(f"Shard {index}: {report}" for report in shard_cache.report)
+                if not (deployed and installed):
+                    if deployed:
+                        shard_container.delete()
+                    return None, None
+            tests = shlex.quote("\n".join(shards[index]))
+            exports = f"export ZEROCI_SHARD_INDEX={index} ZEROCI_SHARD_TOTAL={total} ZEROCI_SHARD_TESTS={tests}\n"
+            try:
+                return shard_container.run_test(id=shard_log_id, run_cmd=exports + line["cmd"])
+            finally:
+                if index:
+                    shard_container.delete()
+
+        with ThreadPoolExecutor(max_workers=total) as executor:
+            shards_results = list(executor.map(run_shard, range(total)))
+
+        status = SUCCESS
+        outputs = []
+        testsuites = []
+        aborted = False
+        failed_shards = []
+        for index, (response, file_path) in enumerate(shards_results):
+            if not response:
+                status = FAILURE
+                failed_shards.append(index)
+                continue
+            outputs.append(response.stdout)
+            if response.returncode:
+                status = FAILURE
+            if response.returncode in [137, 124]:
+                aborted = True
+            if file_path:
+                try:
+                    testsuites.append(utils.xml_parse(path=file_path, line=line["cmd"]))
+                except:
+                    pass
+                os.remove(file_path)
+
+        for index in failed_shards:
+            msg = f"Shard {index} couldn't be built, see the job's logs tagged with shard{index}"
+            outputs.append(f"\n{msg}\n")
+            if testsuites:
+                testcase = {
+                    "classname": "zeroci",
+                    "name": f"shard{index}",
+                    "status": "errored",
+                    "details": {"message": msg},
+                }
+                summary = {"name": "", "tests": 1, "errors": 1, "failures": 0, "skip": 0}
+                testsuites.append({"summary": summary, "testcases": [testcase]})
+
+        status = self._status(container, failed=status != SUCCESS)
+        if testsuites:
+            self._add_result(
+                {"type": TESTSUITE_TYPE, "status": status, "name": name, "content": utils.merge_testsuites(testsuites)}
+            )
+        else:
+            self._add_result({"type": LOG_TYPE, "status": status, "name": name, "content": "".join(outputs)})
+        return not aborted
+
+    def neph_run(self, job_name, line, container, log_id):
         status = SUCCESS
         working_dir = line["working_dir"]
         yaml_path = line["yaml_path"]
         neph_id = f"{self.run_id}:{job_name}:{line['name']}"
         cmd = f"export NEPH_RUN_ID='{neph_id}' \n cd {working_dir} \n /zeroci/bin/neph -y {yaml_path} -m CI"
-        response = container.execute_command(cmd=cmd, id=self.run_id)
-        if response.returncode:
-            status = FAILURE
+        response = container.execute_command(cmd=cmd, id=log_id)
+        status = self._status(container, failed=response.returncode)
 
         name = "{job_name}:{test_name}".format(job_name=job_name, test_name=line["name"])
-        self.model_obj.result.append({"type": LOG_TYPE, "status": status, "name": name, "content": response.stdout})
-        self.model_obj.save()
+        self._add_result({"type": LOG_TYPE, "status": status, "name": name, "content": response.stdout})
 
-        for key in r.keys():
-            key = key.decode()
-            if key.startswith(f"neph:{self.run_id}:{job_name}:{line['name']}"):
-                status = SUCCESS
-                logs = r.lrange(key, 0, -1)
-                all_logs = ""
-                for log in logs:
-                    log = json.loads(log.decode())
-                    if log["type"] == "stderr":
-                        status = FAILURE
-                    all_logs += log["content"]
-                name = key.split(f"neph:{self.run_id}:")[-1]
-                self.model_obj.result.append({"type": LOG_TYPE, "status": status, "name": name, "content": all_logs})
-                self.model_obj.save()
+        neph_keys = [key.decode() for key in r.scan_iter(match=f"neph:{neph_id}*", count=1000)]
+        record_neph_keys(self.run_id, *neph_keys)
+        for key in neph_keys:
+            status = SUCCESS
+            logs = r.lrange(key, 0, -1)
+            all_logs = ""
+            for log in logs:
+                log = json.loads(log.decode())
+                if log["type"] == "stderr":
+                    status = FAILURE
+                all_logs += log["content"]
+            name = key.split(f"neph:{self.run_id}:")[-1]
+            self._add_result({"type": LOG_TYPE, "status": status, "name": name, "content": all_logs})
 
         if response.returncode in [137, 124]:
             return False
         return True
 
-    def build(self, job, clone_details, job_number):
+    def build(self, job, clone_details, job_number, container, log_id, cache=None):
         """Create VM with the required prerequisties and run installation steps to get it ready for running tests.
         """
         env = self._get_run_env()
         deployed = container.deploy(env=env, prerequisites=job["prerequisites"], repo_path=clone_details["remote_path"])
         installed = False
         if deployed:
-            if job_number != 0:
-                self._set_bin()
-            response = container.ssh_command(cmd=clone_details["cmd"])
+            if job["name"] in self._bin_receivers:
+                self._set_bin(container)
+            response = self._clone(container=container, clone_details=clone_details)
             if response.returncode:
                 name = "{job_name}: Clone Repository".format(job_name=job["name"])
                 result = response.stdout
-                r.rpush(self.run_id, result)
+                LiveLogs(log_id).write(result)
             else:
-                response = container.execute_command(cmd=job["install"], id=self.run_id)
+                if cache:
+                    cache.restore(container)
+                response = container.execute_command(cmd=job["install"], id=log_id)
                 if response.returncode:
                     name = "{job_name}: Installation".format(job_name=job["name"])
                     result = response.stdout
@@ -130,21 +309,27 @@ class Actions(Validator):
         else:
             name = "{job_name}: Deploy".format(job_name=job["name"])
             result = "Couldn't deploy a container"
-            r.rpush(self.run_id, result)
+            if container.error:
+                result += f": {container.error}"
+            LiveLogs(log_id).write(result)
 
         if not installed:
-            self.model_obj.result.append({"type": LOG_TYPE, "status": ERROR, "name": name, "content": result})
-            self.model_obj.save()
+            status = self._status(container, failed=True, status=ERROR)
+            self._add_result({"type": LOG_TYPE, "status": status, "name": name, "content": result})
 
         return deployed, installed
 
     def cal_status(self):
         """Calculate the status of the whole tests result has been stored on the BD's id.
         """
+        results = self.model_obj.results
+        results.compact()
         status = SUCCESS
-        for result in self.model_obj.result:
+        for result in results:
             if result["status"] != SUCCESS:
                 status = result["status"]
+        if self.control and self.control.reason:
+            status = self.control.reason
         self.model_obj.status = status
         self.model_obj.save()
 
@@ -174,9 +359,8 @@ class Actions(Validator):
         else:
             msg = "zeroCI.yaml is not found on the repository's home"
 
-        r.rpush(self.run_id, msg)
-        self.model_obj.result.append({"type": LOG_TYPE, "status": ERROR, "name": "Yaml File", "content": msg})
-        self.model_obj.save()
+        LiveLogs(self.run_id).write(msg)
+        self._add_result({"type": LOG_TYPE, "status": ERROR, "name": "Yaml File", "content": msg})
         return False
 
     def repo_clone_details(self):
@@ -194,9 +378,49 @@ class Actions(Validator):
             branch=self.model_obj.branch,
             commit=self.model_obj.commit,
         )
-        clone_details = {"cmd": cmd, "remote_path": repo_remote_path}
+        clone_details = {"cmd": cmd, "remote_path": repo_remote_path, "bundle": None}
+        if self.model_obj.repo in configs.repos:
+            bundle = RepoMirror(self.model_obj.repo).prepare(commit=self.model_obj.commit, control=self.control)
+            if bundle:
+                clone_details["bundle"] = bundle
+                clone_details["bundle_cmd"] = """mkdir -p {repo_remote_path} && cd {repo_remote_path} \\
+                && git init -q \\
+                && git fetch -q {bundle_path} refs/zeroci/{commit} \\
+                && git remote add origin {clone_url} \\
+                && git checkout -q -B {branch} {commit} \\
+                && rm -f {bundle_path}
+                """.format(
+                    clone_url=clone_url,
+                    repo_remote_path=repo_remote_path,
+                    bundle_path=BUNDLE_REMOTE_PATH,
+                    branch=self.model_obj.branch,
+                    commit=self.model_obj.commit,
+                )
         return clone_details
 
+    def _job_cache(self, job, clone_details):
+        if not job.get("cache"):
+            return None
+        if isinstance(self.model_obj, TriggerModel):
+            owner = self.model_obj.repo
+        else:
+            owner = self.model_obj.schedule_name
+        return DependencyCache(
+            owner=owner, job_name=job["name"], cache=job["cache"], repo_path=clone_details["remote_path"]
+        )
+
+    def _clone(self, container, clone_details):
+        """Clone the repo in the pod from the mirror's bundle, or directly from the vcs host as a fallback.
+        """
+        bundle = clone_details.get("bundle")
+        if bundle and container.ssh_set_remote_file(remote_path=BUNDLE_REMOTE_PATH, local_path=bundle):
+            response = container.ssh_command(cmd=clone_details["bundle_cmd"])
+            if not response.returncode:
+                return response
+            cleanup = "find {path} -mindepth 1 -delete\n".format(path=clone_details["remote_path"])
+            return container.ssh_command(cmd=cleanup + clone_details["cmd"])
+        return container.ssh_command(cmd=clone_details["cmd"])
+
     def _prepare_bin_dirs(self, bin_remote_path):
         self.bin_name = bin_remote_path.split(os.path.sep)[-1]
         if isinstance(self.model_obj, TriggerModel):
@@ -213,26 +437,138 @@ class Actions(Validator):
 
         return bin_local_path
 
-    def _get_bin(self, bin_remote_path, job_number):
+    def _get_bin(self, bin_remote_path, job_number, container):
         if bin_remote_path and job_number == 0:
             bin_local_path = self._prepare_bin_dirs(bin_remote_path)
             bin_release = bin_local_path.split(os.path.sep)[-1]
-            bin_tmp_path = os.path.join(self._BIN_DIR, bin_release)
-            cmd = f"cp {bin_remote_path} {bin_tmp_path}"
-            container.execute_command(cmd=cmd, id="", verbose=False)
-            container.ssh_get_remote_file(remote_path=bin_tmp_path, local_path=bin_local_path)
+            copied = container.fetch_file(remote_path=bin_remote_path, local_path=bin_local_path)
 
-            if os.path.exists(bin_local_path):
-                self.model_obj.bin_release = bin_release
-                self.model_obj.save()
+            if copied:
+                with self._lock:
+                    self.model_obj.bin_release = bin_release
+                    self.model_obj.save()
 
-    def _set_bin(self):
+    def _set_bin(self, container):
         if self.model_obj.bin_release:
             bin_local_path = self._prepare_bin_dirs(self.bin_name)
             bin_remote_path = os.path.join(self._BIN_DIR, self.bin_name)
             container.ssh_set_remote_file(remote_path=bin_remote_path, local_path=bin_local_path)
             container.ssh_command(f"chmod +x {bin_remote_path}")
 
+    def _jobs_needs(self, jobs):
+        """Return the needs of every job, if no job uses `needs` every job needs the previous one.
+        """
+        if not any("needs" in job for job in jobs):
+            names = [job["name"] for job in jobs]
+            return {name: names[:i][-1:] for i, name in enumerate(names)}
+        return {job["name"]: job.get("needs") or [] for job in jobs}
+
+    def _run_job(self, job, clone_details, job_number, parallel):
+        """Deploy, install and run the tests of one job in its own container.
+
+        :return: True if the job passed all its steps.
+        """
+        # lines of parallel jobs are tagged with the job's name in the run's logs.
+        log_id = f"{self.run_id}:{job['name']}" if parallel else self.run_id
+        log = """
+        ******************************************************
+        Starting {job_name} job
+        ******************************************************
+        """.format(
+            job_name=job["name"]
+        ).replace(
+            "  ", ""
+        )
+        LiveLogs(log_id).write(log)
+        control = self.control.job(timeout=job.get("timeout"))
+        container = Container(run_id=self.run_id, control=control)
+        cache = self._job_cache(job=job, clone_details=clone_details)
+        worked = False
+        deployed, installed = self.build(
+            job=job, clone_details=clone_details, job_number=job_number, container=container, log_id=log_id, cache=cache
+        )
+        if deployed:
+            if installed:
+                worked = self.test_run(
+                    job=job,
+                    container=container,
+                    log_id=log_id,
+                    clone_details=clone_details,
+                    job_number=job_number,
+                    cache=cache,
+                )
+                self._get_bin(bin_remote_path=job.get("bin_path"), job_number=job_number, container=container)
+                if cache and worked:
+                    cache.save(container)
+            if cache and cache.report:
+                name = "{job_name}: Cache".format(job_name=job["name"])
+                content = "\n".join(cache.report)
+                self._add_result({"type": LOG_TYPE, "status": SUCCESS, "name": name, "content": content})
+            container.delete()
+        return deployed and installed and worked
+
+    def _bin_jobs(self, jobs, needs):
+        """Get the jobs that start after the first job finished, only they can get the bin it generates.
+        """
+        receivers = set()
+        changed = True
+        while changed:
+            changed = False
+            for name, job_needs in needs.items():
+                if name not in receivers and any(n == jobs[0]["name"] or n in receivers for n in job_needs):
+                    receivers.add(name)
+                    changed = True
+        return receivers
+
+    def _run_jobs(self, jobs, clone_details):
+        """Run the jobs graph, a job starts once all of its needs passed.
+        """
+        needs = self._jobs_needs(jobs)
+        self._bin_receivers = self._bin_jobs(jobs, needs)
+        parallel = any("needs" in job for job in jobs)
+        numbers = {job["name"]: i for i, job in enumerate(jobs)}
+        pending = list(jobs)
+        passed = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=PARALLEL_JOBS) as executor:
+            while pending or running:
+                if pending and self.control.check():
+                    LiveLogs(self.run_id).write(f"\n{self.control.message}, skipping the rest of jobs\n")
+                    for job in pending:
+                        passed[job["name"]] = False
+                    pending = []
+                for job in list(pending):
+                    job_needs = needs[job["name"]]
+                    if not all(need in passed for need in job_needs):
+                        continue
+                    pending.remove(job)
+                    if all(passed[need] for need in job_needs):
+                        future = executor.submit(
+                            self._run_job,
+                            job=job,
+                            clone_details=clone_details,
+                            job_number=numbers[job["name"]],
+                            parallel=parallel,
+                        )
+                        running[future] = job["name"]
+                    else:
+                        passed[job["name"]] = False
+                        if parallel:
+                            msg = f"\nSkipping {job['name']} job as one of its needs didn't pass\n"
+                            LiveLogs(self.run_id).write(msg)
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        passed[name] = future.result()
+                    except Exception:
+                        msg = traceback.format_exc()
+                        LiveLogs(self.run_id).write(msg)
+                        self._add_result({"type": LOG_TYPE, "status": ERROR, "name": name, "content": msg})
+                        passed[name] = False
+
     def build_and_test(self, id, schedule_name=None, script=None):
         """Builds, runs tests, calculates status and gives report on telegram and your version control system.
         
@@ -242,46 +578,52 @@ class Actions(Validator):
         :param schedule_name: str
         """
         self.run_id = id
+        self.control = RunControl(run_id=self.run_id)
         if not schedule_name:
             self.model_obj = TriggerRun.get(id=self.run_id)
-            script = self._load_yaml()
         else:
             self.model_obj = SchedulerRun.get(id=self.run_id)
-        if script:
-            valid = self.validate_yaml(run_id=self.run_id, model_obj=self.model_obj, script=script)
-            if valid:
-                clone_details = self.repo_clone_details()
-                worked = deployed = installed = True
-                for i, job in enumerate(script["jobs"]):
-                    if not (worked and deployed and installed):
-                        break
-                    log = """
-                    ******************************************************
-                    Starting {job_name} job
-                    ******************************************************
-                    """.format(
-                        job_name=job["name"]
-                    ).replace(
-                        "  ", ""
-                    )
-                    r.rpush(self.run_id, log)
-                    deployed, installed = self.build(job=job, clone_details=clone_details, job_number=i)
-                    if deployed:
-                        if installed:
-                            worked = self.test_run(job=job)
-                            self._get_bin(bin_remote_path=job.get("bin_path"), job_number=i)
-                        container.delete()
-        r.rpush(self.run_id, "hamada ok")
+        try:
+            if not schedule_name:
+                script = self._load_yaml()
+            if script:
+                valid = self.validate_yaml(run_id=self.run_id, model_obj=self.model_obj, script=script)
+                if valid:
+                    self.control = RunControl(run_id=self.run_id, timeout=script.get("timeout"))
+                    clone_details = self.repo_clone_details()
+                    self._run_jobs(jobs=script["jobs"], clone_details=clone_details)
+        except Exception:
+            msg = traceback.format_exc()
+            LiveLogs(self.run_id).write(msg)
+            self._add_result({"type": LOG_TYPE, "status": ERROR, "name": "Run", "content": msg})
+        finally:
+            try:
+                # let the pods' deletion finish before the work horse exits, the sweep deletes what is left.
+                reaper.wait()
+            except Exception:
+                traceback.print_exc()
+            self._finish(schedule_name=schedule_name)
+
+    def _finish(self, schedule_name=None):
+        """End the run's logs, store its status and report it, every way out of the run goes through here.
+        """
+        LiveLogs(self.run_id).end()
         self.cal_status()
+        RunControl.clear(self.run_id)
+        try:
+            LogArchive(self.run_id).archive()
+            Storage().account(run_id=self.run_id, run=self.model_obj)
+        except Exception:
+            # the cleanup archives and counts the run's logs later.
+            traceback.print_exc()
         reporter.report(run_id=self.run_id, model_obj=self.model_obj, schedule_name=schedule_name)
 
-    def schedule_run(self, job):
-        """Builds, runs tests, calculates status and gives report on telegram.
+    def create_schedule_run(self, job):
+        """Create a pending run of the schedule and publish its status.
 
-        :param schedule_name: the name of the scheduled run.
-        :type schedule_name: str
-        :param script: the script that should run your schedule.
-        :type script: str
+        :param job: the schedule's name, script and who triggered it.
+        :type job: dict
+        :return: run id.
         """
         triggered_by = job.get("triggered_by", "ZeroCI Scheduler")
         data = {
@@ -296,4 +638,18 @@ class Actions(Validator):
         id = str(scheduler_run.id)
         data["id"] = id
         r.publish("zeroci_status", json.dumps(data))
+        return id
+
+    def schedule_run(self, job):
+        """Builds, runs tests, calculates status and gives report on telegram.
+
+        :param schedule_name: the name of the scheduled run.
+        :type schedule_name: str
+        :param script: the script that should run your schedule.
+        :type script: str
+        """
+        id = self.create_schedule_run(job)
+        rq_job = get_current_job()
+        if rq_job:
+            RunControl.set_rq_job(run_id=id, job_id=rq_job.get_id())
         self.build_and_test(id=id, schedule_name=job["schedule_name"], script=job)
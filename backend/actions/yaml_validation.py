@@ -1,9 +1,10 @@
-import requests
-from redis import Redis
+from deployment.admission import RESOURCES, parse_quantity
+from packages.registry.registry import ImageChecker
+from utils.live_logs import LiveLogs
 
-redis = Redis()
 ERROR = "error"
 LOG_TYPE = "log"
+MAX_PARALLELISM = 10
 
 
 class Validator:
@@ -43,6 +44,13 @@ class Validator:
                         else:
                             if not isinstance(cmd, str):
                                 msg = "Every cmd in script should be str"
+                        parallelism = item.get("parallelism")
+                        if parallelism is not None:
+                            if not isinstance(parallelism, int) or not 1 <= parallelism <= MAX_PARALLELISM:
+                                msg = f"parallelism should be int between 1 and {MAX_PARALLELISM}"
+                        collect = item.get("collect")
+                        if collect is not None and not isinstance(collect, str):
+                            msg = "collect should be str"
         return msg
 
     def _validate_install_script(self, install_script):
@@ -55,7 +63,7 @@ class Validator:
 
         return msg
 
-    def _validate_prerequisites(self, prerequisites):
+    def _validate_prerequisites(self, prerequisites, images=None):
         msg = ""
         if not prerequisites:
             msg = "prerequisites should be in job file and shouldn't be empty"
@@ -70,18 +78,42 @@ class Validator:
                     if not isinstance(image_name, str):
                         msg = "image_name should be str"
                     else:
-                        if ":" in image_name:
-                            repository, tag = image_name.split(":")
-                        else:
-                            repository = image_name
-                            tag = "latest"
-                        response = requests.get(f"https://index.docker.io/v1/repositories/{repository}/tags/{tag}")
-                        if response.status_code is not requests.codes.ok:
+                        exists = (images or {}).get(image_name)
+                        if exists is None:
+                            exists = ImageChecker().exists(image_name)
+                        if not exists:
                             msg = "Invalid docker image's name "
                 shell_bin = prerequisites.get("shell_bin")
                 if shell_bin:
                     if not isinstance(shell_bin, str):
                         msg = "shell_bin should be str"
+                resources = prerequisites.get("resources")
+                if resources is not None:
+                    msg = self._validate_resources(resources) or msg
+        return msg
+
+    def _validate_resources(self, resources):
+        msg = ""
+        if not isinstance(resources, dict):
+            return "resources should be dict"
+        values = {}
+        for kind, quantities in resources.items():
+            if kind not in ["requests", "limits"]:
+                return f"{kind} is not supported in resources, only requests and limits are supported"
+            if not isinstance(quantities, dict):
+                return f"{kind} of resources should be dict"
+            for resource, value in quantities.items():
+                if resource not in RESOURCES:
+                    return f"{resource} is not supported in {kind}, only cpu and memory are supported"
+                try:
+                    values[(kind, resource)] = parse_quantity(value)
+                except ValueError:
+                    return f"{resource} of {kind} should be a valid quantity, e.g. 500m for cpu or 1Gi for memory"
+        for resource in RESOURCES:
+            request = values.get(("requests", resource))
+            limit = values.get(("limits", resource))
+            if request and limit and request > limit:
+                msg = f"{resource} request shouldn't be more than its limit"
         return msg
 
     def _validate_bin_path(self, bin_path):
@@ -92,6 +124,67 @@ class Validator:
 
         return msg
 
+    def _validate_needs(self, needs):
+        msg = ""
+        if needs is not None:
+            if not isinstance(needs, list):
+                msg = "needs should be list"
+            else:
+                for need in needs:
+                    if not isinstance(need, str):
+                        msg = "Every element in needs should be str"
+        return msg
+
+    def _validate_jobs_graph(self, jobs):
+        names = [job["name"] for job in jobs]
+        if len(set(names)) != len(names):
+            return "jobs' names should be unique"
+        needs = {job["name"]: job.get("needs") or [] for job in jobs}
+        for name, job_needs in needs.items():
+            for need in job_needs:
+                if need not in needs:
+                    return f"{need} in needs of {name} job is not found"
+                if need == name:
+                    return f"{name} job can't need itself"
+
+        # remove the jobs that have all their needs satisfied until nothing is left or there is a cycle.
+        done = set()
+        while len(done) != len(needs):
+            ready = [name for name, job_needs in needs.items() if name not in done and set(job_needs) <= done]
+            if not ready:
+                return "needs shouldn't have a cycle"
+            done.update(ready)
+        return ""
+
+    def _validate_timeout(self, timeout):
+        msg = ""
+        if timeout is not None:
+            if not isinstance(timeout, int) or isinstance(timeout, bool) or timeout <= 0:
+                msg = "timeout should be a positive int of seconds"
+        return msg
+
+    def _validate_cache(self, cache):
+        msg = ""
+        if cache is not None:
+            if not isinstance(cache, dict):
+                msg = "cache should be dict"
+            else:
+                key = cache.get("key")
+                if not key:
+                    msg = "cache should contain key and shouldn't be empty"
+                elif not isinstance(key, str):
+                    msg = "key of cache should be str"
+                paths = cache.get("paths")
+                if not paths:
+                    msg = "cache should contain paths and shouldn't be empty"
+                elif not isinstance(paths, list):
+                    msg = "paths of cache should be list"
+                else:
+                    for path in paths:
+                        if not isinstance(path, str):
+                            msg = "Every element in paths of cache should be str"
+        return msg
+
     def _validate_job_name(self, name):
         msg = ""
         if not name:
@@ -104,11 +197,21 @@ class Validator:
 
     def _report(self, run_id, model_obj, msg):
         msg = f"{msg} (see examples: https://github.com/threefoldtech/zeroCI/tree/development/docs/config)"
-        redis.rpush(run_id, msg)
-        model_obj.result.append({"type": LOG_TYPE, "status": ERROR, "name": "Yaml File", "content": msg})
-        model_obj.save()
+        LiveLogs(run_id).write(msg)
+        model_obj.results.append({"type": LOG_TYPE, "status": ERROR, "name": "Yaml File", "content": msg})
+
+    def _check_images(self, jobs):
+        """Check the jobs' images concurrently before validating every job.
+        """
+        images = []
+        for job in jobs:
+            if isinstance(job, dict) and isinstance(job.get("prerequisites"), dict):
+                image_name = job["prerequisites"].get("image_name")
+                if image_name and isinstance(image_name, str):
+                    images.append(image_name)
+        return ImageChecker().exists_many(images)
 
-    def _validate_job(self, job):
+    def _validate_job(self, job, images=None):
         job_name = job.get("name")
         msg = self._validate_job_name(job_name)
         if msg:
@@ -119,6 +222,21 @@ class Validator:
         if msg:
             return msg
 
+        needs = job.get("needs")
+        msg = self._validate_needs(needs)
+        if msg:
+            return msg
+
+        timeout = job.get("timeout")
+        msg = self._validate_timeout(timeout)
+        if msg:
+            return msg
+
+        cache = job.get("cache")
+        msg = self._validate_cache(cache)
+        if msg:
+            return msg
+
         test_script = job.get("script")
         msg = self._validate_test_script(test_script)
         if msg:
@@ -130,7 +248,7 @@ class Validator:
             return msg
 
         prerequisites = job.get("prerequisites")
-        msg = self._validate_prerequisites(prerequisites)
+        msg = self._validate_prerequisites(prerequisites, images=images)
         return msg
 
     def validate_yaml(self, run_id, model_obj, script):
@@ -144,10 +262,15 @@ class Validator:
                 if len(jobs) > 3:
                     msg = "jobs shouldn't be more than 3"
                 else:
-                    for job in jobs:
-                        msg = self._validate_job(job)
-                        if msg:
-                            break
+                    msg = self._validate_timeout(script.get("timeout"))
+                    if not msg:
+                        images = self._check_images(jobs)
+                        for job in jobs:
+                            msg = self._validate_job(job, images=images)
+                            if msg:
+                                break
+                        else:
+                            msg = self._validate_jobs_graph(jobs)
         if msg:
             self._report(run_id=run_id, model_obj=model_obj, msg=msg)
             return False
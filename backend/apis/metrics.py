@@ -0,0 +1,12 @@
+import json
+
+from apis.base import app, check_configs
+from utils.metrics import Metrics
+
+
+@app.route("/api/metrics")
+@check_configs
+def metrics():
+    """Return the counters and timings recorded by the server and the workers.
+    """
+    return json.dumps(Metrics.all())
@@ -1,18 +1,53 @@
 import json
 
 from apis.base import app, check_configs
-from bottle import abort, redirect, request, static_file
+from bottle import abort, redirect, request, response
 from models.initial_config import InitialConfig
 from models.schedule_info import ScheduleInfo
 from models.scheduler_run import SchedulerRun
 from models.trigger_run import TriggerRun
-from packages.vcs.vcs import VCSFactory
+from utils.branch_index import BranchIndex
+from utils.latest_status import LatestStatus
+from utils.live_logs import LiveLogs
+from utils.log_archive import LogArchive
 
 
 SUCCESS = "success"
 FAILURE = "failure"
 ERROR = "error"
 PENDING = "pending"
+MAX_LIMIT = 500
+BADGES = {}
+
+
+def _runs_page(factory, fields, **where):
+    """Get the newest runs matching `where` after the `cursor` query parameter, at most `limit` runs.
+
+    The cursor of the next page is sent in `X-Next-Cursor` header, it is missing on the last page.
+    """
+    limit = request.query.get("limit")
+    cursor = request.query.get("cursor") or None
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return abort(400, "limit should be a number")
+        if limit <= 0 or limit > MAX_LIMIT:
+            return abort(400, f"limit should be between 1 and {MAX_LIMIT}")
+    if cursor:
+        try:
+            score, _ = cursor.split(":", 1)
+            float(score)
+        except ValueError:
+            return abort(400, "Invalid cursor")
+
+    next_cursor, runs = factory.latest(fields=fields, limit=limit, cursor=cursor, **where)
+    if next_cursor:
+        response.set_header("X-Next-Cursor", next_cursor)
+    total = factory.count(**where)
+    if total is not None:
+        response.set_header("X-Total-Count", str(total))
+    return runs
 
 
 @app.route("/api/")
@@ -36,27 +71,31 @@ def branch(repo):
     :param repo: repo's name
     :param branch: the branch's name in the repo
     :param id: DB id of test details.
+    :param step: index of a step to return only its result with `offset` and `length` characters of its log.
+    :param limit: maximum number of runs to be returned, all runs if it isn't sent.
+    :param cursor: `X-Next-Cursor` header of the previous page.
     """
     branch = request.query.get("branch")
     id = request.query.get("id")
 
     if id:
         trigger_run = TriggerRun.get(id=id)
-        live = True if trigger_run.status == PENDING else False
-        result = json.dumps({"live": live, "result": trigger_run.result})
-        return result
+        return _run_details(trigger_run)
     if branch:
         fields = ["status", "commit", "committer", "timestamp", "bin_release", "triggered_by"]
         where = {"repo": repo, "branch": branch}
-        trigger_runs = TriggerRun.get_objects(fields=fields, order_by="timestamp", asc=False, **where)
+        trigger_runs = _runs_page(TriggerRun, fields=fields, **where)
         result = json.dumps(trigger_runs)
         return result
 
-    vcs_obj = VCSFactory().get_cvn(repo=repo)
-    exist_branches = vcs_obj.get_branches()
-    all_branches = TriggerRun.distinct(field="branch", repo=repo)
-    deleted_branches = list(set(all_branches) - set(exist_branches))
-    branches = {"exist": exist_branches, "deleted": deleted_branches}
+    branch_index = BranchIndex()
+    exist_branches = branch_index.vcs_branches(repo=repo)
+    if exist_branches is None:
+        # without the VCS list every branch would be reported as deleted.
+        return abort(503, "Couldn't get the branches from the version control system")
+    runs = branch_index.branches(repo=repo)
+    deleted_branches = list(set(runs) - set(exist_branches))
+    branches = {"exist": exist_branches, "deleted": deleted_branches, "runs": runs}
     result = json.dumps(branches)
     return result
 
@@ -68,21 +107,137 @@ def schedules(schedule):
 
     :param schedule: schedule's name
     :param id: DB id of test details.
+    :param step: index of a step to return only its result with `offset` and `length` characters of its log.
+    :param limit: maximum number of runs to be returned, all runs if it isn't sent.
+    :param cursor: `X-Next-Cursor` header of the previous page.
     """
     id = request.query.get("id")
     if id:
         scheduler_run = SchedulerRun.get(id=id)
-        live = True if scheduler_run.status == PENDING else False
-        result = json.dumps({"live": live, "result": scheduler_run.result})
-        return result
+        return _run_details(scheduler_run)
 
     fields = ["status", "timestamp", "bin_release", "triggered_by"]
     where = {"schedule_name": schedule}
-    scheduler_runs = SchedulerRun.get_objects(fields=fields, order_by="timestamp", asc=False, **where)
+    scheduler_runs = _runs_page(SchedulerRun, fields=fields, **where)
     result = json.dumps(scheduler_runs)
     return result
 
 
+def _int_param(name, default=None):
+    value = request.query.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        return abort(400, f"{name} should be a number")
+    if value < 0:
+        return abort(400, f"{name} shouldn't be negative")
+    return value
+
+
+def _run_details(model_obj):
+    """Return the run's results, or only one step's result if `step` is sent.
+    """
+    if not model_obj:
+        return abort(404)
+    live = True if model_obj.status == PENDING else False
+    step = _int_param("step")
+    if step is None:
+        return json.dumps({"live": live, "result": list(model_obj.results)})
+
+    result = model_obj.results.get(step)
+    if result is None:
+        return abort(404)
+    if isinstance(result.get("content"), str):
+        offset = _int_param("offset", 0)
+        length = _int_param("length")
+        content = result["content"]
+        result["size"] = len(content)
+        result["content"] = content[offset:] if length is None else content[offset : offset + length]
+    return json.dumps({"live": live, "result": result})
+
+
+@app.route("/api/logs/<id>")
+@check_configs
+def run_logs(id):
+    """Returns a range of the run's logs as text, only the needed segments are read once the run finishes.
+
+    :param id: DB id of the run.
+    :param offset: first byte to be returned.
+    :param length: number of bytes to be returned, all the rest if it isn't sent.
+    :param line: first line to be returned, it is used instead of `offset` if it is sent.
+    :param lines: number of lines to be returned, all the rest if it isn't sent.
+    """
+    offset = _int_param("offset", 0)
+    length = _int_param("length")
+    line = _int_param("line")
+    lines = _int_param("lines")
+    archive = LogArchive(id)
+    index = archive.index()
+    if index:
+        total_bytes, total_lines = index["size"], index["lines"]
+        if line is not None:
+            content = archive.read_lines(line=line, count=lines)
+        else:
+            content = archive.read(offset=offset, length=length)
+    else:
+        live_logs = LiveLogs(id)
+        if not live_logs.exists():
+            return abort(404)
+        logs, _ = live_logs.read_all()
+        total_bytes = len(logs)
+        all_lines = logs.splitlines(keepends=True)
+        total_lines = len(all_lines)
+        if line is not None:
+            content = b"".join(all_lines[line:] if lines is None else all_lines[line : line + lines])
+        else:
+            content = logs[offset:] if length is None else logs[offset : offset + length]
+    response.set_header("X-Total-Bytes", str(total_bytes))
+    response.set_header("X-Total-Lines", str(total_lines))
+    response.content_type = "text/plain; charset=utf-8"
+    return content
+
+
+def _latest_finished(factory, **where):
+    """Get the last finished run from its record, it is recorded from the index if it isn't found.
+    """
+    latest_status = LatestStatus()
+    latest = latest_status.get(**where)
+    if latest:
+        return latest
+    _, runs = factory.latest(fields=["status", "timestamp"], limit=1, status=[ERROR, FAILURE, SUCCESS], **where)
+    if not runs:
+        return None
+    run = runs[0]
+    latest_status.set(run_id=run["id"], status=run["status"], timestamp=run["timestamp"], **where)
+    return {"id": run["id"], "status": run["status"], "timestamp": run["timestamp"]}
+
+
+def _etag_matches(etag):
+    """Check if the request's If-None-Match has this ETag, weak ones are compared without their `W/`.
+    """
+    tags = [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+
+def _badge(status):
+    """Return the status badge, it has an ETag of the status so clients revalidate it on every request.
+    """
+    name = "build_passing" if status == SUCCESS else "build_failing"
+    etag = f'"{name}"'
+    response.set_header("ETag", etag)
+    response.set_header("Cache-Control", "no-cache")
+    if _etag_matches(etag):
+        response.status = 304
+        return ""
+    if name not in BADGES:
+        with open(f"svgs/{name}.svg", "rb") as f:
+            BADGES[name] = f.read()
+    response.content_type = "image/svg+xml"
+    return BADGES[name]
+
+
 @app.route("/status")
 @check_configs
 def status():
@@ -92,35 +247,26 @@ def status():
     repo = request.query.get("repo")
     branch = request.query.get("branch")
     result = request.query.get("result")  # to return the run result
-    fields = ["status"]
     configs = InitialConfig()
     if schedule:
-        where = {"schedule_name": schedule, "status": f"{ERROR} OR {FAILURE} OR {SUCCESS}"}
-        scheduler_run = SchedulerRun.get_objects(fields=fields, order_by="timestamp", asc=False, **where)
-        if len(scheduler_run) == 0:
+        latest = _latest_finished(SchedulerRun, schedule_name=schedule)
+        if not latest:
             return abort(404)
 
         if result:
-            link = f"{configs.domain}/schedules/{schedule}?id={str(scheduler_run[0]['id'])}"
+            link = f"{configs.domain}/schedules/{schedule}?id={latest['id']}"
             return redirect(link)
-        if scheduler_run[0]["status"] == SUCCESS:
-            return static_file("svgs/build_passing.svg", mimetype="image/svg+xml", root=".")
-        else:
-            return static_file("svgs/build_failing.svg", mimetype="image/svg+xml", root=".")
+        return _badge(latest["status"])
 
     elif repo:
         if not branch:
             branch = "master"
-        where = {"repo": repo, "branch": branch, "status": f"{ERROR} OR {FAILURE} OR {SUCCESS}"}
-        trigger_run = TriggerRun.get_objects(fields=fields, order_by="timestamp", asc=False, **where)
-        if len(trigger_run) == 0:
+        latest = _latest_finished(TriggerRun, repo=repo, branch=branch)
+        if not latest:
             return abort(404)
         if result:
-            link = f"{configs.domain}/repos/{repo.replace('/', '%2F')}/{branch}/{str(trigger_run[0]['id'])}"
+            link = f"{configs.domain}/repos/{repo.replace('/', '%2F')}/{branch}/{latest['id']}"
             return redirect(link)
-        if trigger_run[0]["status"] == SUCCESS:
-            return static_file("svgs/build_passing.svg", mimetype="image/svg+xml", root=".")
-        else:
-            return static_file("svgs/build_failing.svg", mimetype="image/svg+xml", root=".")
+        return _badge(latest["status"])
 
     return abort(404)
@@ -9,6 +9,7 @@ from apis.base import app, check_configs, user
 from bottle import HTTPResponse, abort, redirect, request
 from models.schedule_info import ScheduleInfo
 from models.scheduler_run import SchedulerRun
+from utils.run_control import RunControl
 
 actions = Actions()
 q = Queue(connection=Redis())
@@ -91,7 +92,7 @@ def schedule_trigger():
         schedule_name = request.json.get("schedule_name")
 
         where = {"schedule_name": schedule_name}
-        runs = SchedulerRun.get_objects(fields=["status"], order_by="timestamp", asc=False, **where)
+        _, runs = SchedulerRun.latest(fields=["status"], limit=1, **where)
         if runs and runs[0]["status"] == PENDING:
             return HTTPResponse(
                 f"There is a running job from this schedule {schedule_name}, please try again after this run finishes",
@@ -109,7 +110,16 @@ def schedule_trigger():
             "triggered_by": request.environ.get("beaker.session").get("username").strip(".3bot"),
             "bin_path": schedule_info.bin_path,
         }
-        job = q.enqueue_call(func=actions.schedule_run, args=(job,), result_ttl=5000, timeout=20000,)
-        if job:
-            return HTTPResponse(job.get_id(), 200)
+        # the run is created before enqueueing, so it can be cancelled while waiting in the queue.
+        id = actions.create_schedule_run(job)
+        rq_job = q.enqueue_call(
+            func=actions.build_and_test,
+            args=(id,),
+            kwargs={"schedule_name": schedule_name, "script": job},
+            result_ttl=5000,
+            timeout=20000,
+        )
+        if rq_job:
+            RunControl.set_rq_job(run_id=id, job_id=rq_job.get_id())
+            return HTTPResponse(rq_job.get_id(), 200)
     return HTTPResponse("Wrong data", 400)
@@ -4,19 +4,31 @@ from datetime import datetime
 
 from redis import Redis
 from rq import Queue
+from rq.job import Job
 
 from actions.actions import Actions
 from apis.base import app, check_configs, user
 from bottle import HTTPResponse, redirect, request
 from models.initial_config import InitialConfig
+from models.scheduler_run import SchedulerRun
 from models.trigger_run import TriggerRun
+from packages.vcs.mirror import refresh_mirror
 from packages.vcs.vcs import VCSFactory
+from utils.branch_index import BranchIndex
+from utils.latest_status import LatestStatus
+from utils.live_logs import LiveLogs
+from utils.log_archive import LogArchive
+from utils.maintenance import maintenance_queue
+from utils.reporter import Reporter
+from utils.run_control import CANCELLED, RunControl
+from utils.storage import Storage
 
 BIN_DIR = "/zeroci/bin/"
 
 redis = Redis()
 actions = Actions()
 q = Queue(connection=redis)
+reporter = Reporter()
 PENDING = "pending"
 
 
@@ -42,6 +54,9 @@ def trigger(repo="", branch="", commit="", committer="", id=None, triggered=True
         trigger_run.timestamp = int(timestamp)
         trigger_run.status = status
         trigger_run.result = []
+        trigger_run.results.clear()
+        LogArchive(id).clear()
+        Storage().release(id)
         trigger_run.triggered_by = triggered_by
         if trigger_run.bin_release:
             bin_path = os.path.join(BIN_DIR, trigger_run.repo, trigger_run.branch, trigger_run.bin_release)
@@ -49,6 +64,8 @@ def trigger(repo="", branch="", commit="", committer="", id=None, triggered=True
                 os.remove(bin_path)
         trigger_run.bin_release = None
         trigger_run.save()
+        # the badge goes back to the last run that is still finished.
+        LatestStatus().forget(id, repo=trigger_run.repo, branch=trigger_run.branch)
         for key in redis.keys():
             if id in key.decode():
                 redis.delete(key)
@@ -75,10 +92,14 @@ def trigger(repo="", branch="", commit="", committer="", id=None, triggered=True
             data["id"] = id
             redis.publish("zeroci_status", json.dumps(data))
     if id:
+        BranchIndex().record(
+            repo=trigger_run.repo, branch=trigger_run.branch, run_id=id, status=status, timestamp=trigger_run.timestamp
+        )
         link = f"{configs.domain}/repos/{trigger_run.repo}/{trigger_run.branch}/{str(trigger_run.id)}"
         vcs_obj = VCSFactory().get_cvn(repo=trigger_run.repo)
         vcs_obj.status_send(status=status, link=link, commit=trigger_run.commit)
         job = q.enqueue_call(func=actions.build_and_test, args=(id,), result_ttl=5000, timeout=20000)
+        RunControl.set_rq_job(run_id=id, job_id=job.get_id())
         return job
     return None
 
@@ -100,7 +121,10 @@ def git_trigger():
                 committer = request.json["pusher"]["name"]
             else:
                 committer = request.json["pusher"]["login"]
+            if repo in configs.repos:
+                maintenance_queue.enqueue_call(func=refresh_mirror, args=(repo,), result_ttl=0, timeout=900)
             branch_exist = not commit.startswith("000000")
+            BranchIndex().pushed(repo=repo, branch=branch, deleted=not branch_exist)
             if branch_exist:
                 job = trigger(repo=repo, branch=branch, commit=commit, committer=committer, triggered=False)
                 if job:
@@ -133,7 +157,7 @@ def run_trigger():
         last_commit = vcs_obj.get_last_commit(branch=branch)
         committer = vcs_obj.get_committer(commit=last_commit)
         where = {"repo": repo, "branch": branch, "commit": last_commit, "status": PENDING}
-        run = TriggerRun.get_objects(fields=["status"], **where)
+        _, run = TriggerRun.latest(fields=["status"], limit=1, **where)
         if run:
             return HTTPResponse(
                 f"There is a running job from this commit {last_commit}, please try again after this run finishes", 503
@@ -145,3 +169,52 @@ def run_trigger():
         if job:
             return HTTPResponse(job.get_id(), 200)
         return HTTPResponse("Wrong data", 400)
+
+
+@app.route("/api/cancel", method=["POST"])
+@user
+@check_configs
+def cancel():
+    """Cancel a run, it is removed from the queue if it hasn't started yet.
+    """
+    if request.headers.get("Content-Type") == "application/json":
+        id = request.json.get("id")
+        run = TriggerRun.get(id=id)
+        schedule_name = None
+        if not run:
+            run = SchedulerRun.get(id=id)
+            if not run:
+                return HTTPResponse(f"There is no run with this id {id}", 400)
+            schedule_name = run.schedule_name
+        if run.status != PENDING:
+            return HTTPResponse(f"This run {id} has already finished", 400)
+
+        RunControl.cancel(run_id=id)
+        job_id = RunControl.get_rq_job(run_id=id)
+        job = None
+        if job_id:
+            try:
+                job = Job.fetch(job_id, connection=redis)
+            except Exception:
+                job = None
+        job_status = job.get_status() if job else None
+        if job_status == "started":
+            # the run stops within a few seconds and is reported by its worker.
+            return HTTPResponse("Cancelling", 202)
+        if job_status in ["queued", "deferred", "scheduled"]:
+            job.cancel()
+            RunControl.clear(run_id=id)
+            msg = "Run has been cancelled before it started"
+        else:
+            # nothing will pick the run up, e.g. its worker died.
+            msg = "Run has been cancelled, its job was no longer running"
+        run.status = CANCELLED
+        run.save()
+        live_logs = LiveLogs(id)
+        live_logs.write(msg)
+        live_logs.end()
+        LogArchive(id).archive()
+        Storage().account(run_id=id, run=run)
+        reporter.report(run_id=id, model_obj=run, schedule_name=schedule_name)
+        return HTTPResponse("Cancelled", 200)
+    return HTTPResponse("Wrong content type", 400)
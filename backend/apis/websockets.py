@@ -1,12 +1,44 @@
-from gevent import sleep
+from gevent import sleep, spawn
 from redis import Redis
 import json
 
 from apis.base import app
 from bottle import abort, request
 from geventwebsocket import WebSocketError
+from utils.hub import ARCHIVED, CLOSED, DROPPED, hub
+from utils.live_logs import LEGACY_END_MARKER, LiveLogs
+from utils.log_archive import LogArchive
 
 redis = Redis()
+# "try again later" close code sent to the clients dropped for being too slow.
+DROPPED_CODE = 1013
+
+
+def _watch(wsock, subscription):
+    """Stop the subscription once the client closes the websocket, instead of on the next message sent to it.
+    """
+    try:
+        while wsock.receive() is not None:
+            pass
+    except WebSocketError:
+        pass
+    subscription.stop(CLOSED)
+
+
+def _send_subscription(wsock, subscription, decode):
+    """Send the messages of a subscription until it ends, a dropped client gets the reason in the close frame.
+    """
+    watcher = spawn(_watch, wsock, subscription)
+    try:
+        for message in subscription:
+            wsock.send(decode(message))
+        if subscription.end == DROPPED:
+            wsock.close(code=DROPPED_CODE, message=b"Client is too slow, reconnect to continue")
+    except WebSocketError:
+        pass
+    finally:
+        watcher.kill()
+        subscription.close()
 
 
 @app.route("/websocket/logs/<id>")
@@ -15,6 +47,40 @@ def logs(id):
     if not wsock:
         abort(400, "Expected WebSocket request.")
 
+    archive = LogArchive(id)
+    if archive.exists():
+        # finished run, its logs are sent from the archive segment by segment.
+        for segment in archive.iter_segments():
+            try:
+                wsock.send(segment.decode(errors="replace"))
+            except WebSocketError:
+                break
+        return
+
+    live_logs = LiveLogs(id)
+    if live_logs.legacy():
+        _legacy_logs(wsock, id)
+        return
+
+    subscription = hub.logs(id)
+    sent = 0
+
+    def decode(content):
+        nonlocal sent
+        sent += len(content)
+        return content.decode(errors="replace")
+
+    _send_subscription(wsock, subscription, decode)
+    if subscription.end == ARCHIVED:
+        try:
+            wsock.send(archive.read(offset=sent).decode(errors="replace"))
+        except WebSocketError:
+            pass
+
+
+def _legacy_logs(wsock, id):
+    """Send the logs of a run started before using streams from its list.
+    """
     start = 0
     while start != -1:
         length = redis.llen(id)
@@ -24,8 +90,8 @@ def logs(id):
             sleep(0.01)
             continue
         result_list = redis.lrange(id, start, length)
-        if b"hamada ok" in result_list:
-            result_list.remove(b"hamada ok")
+        if LEGACY_END_MARKER in result_list:
+            result_list.remove(LEGACY_END_MARKER)
             start = -1
         else:
             start += len(result_list)
@@ -45,6 +111,15 @@ def neph_logs(neph_id):
     if not wsock:
         abort(400, "Expected WebSocket request.")
 
+    run_id = neph_id.split(":")[1] if neph_id.count(":") > 1 else None
+    name = LogArchive(run_id).neph_keys().get(neph_id) if run_id else None
+    if name:
+        try:
+            wsock.send(LogArchive(run_id).read(name=name).decode(errors="replace"))
+        except WebSocketError:
+            pass
+        return
+
     start = 0
     while start != -1:
         length = redis.llen(neph_id)
@@ -73,6 +148,14 @@ def neph_jobs(id):
     if not wsock:
         abort(400, "Expected WebSocket request.")
 
+    archive = LogArchive(id)
+    if archive.exists():
+        try:
+            wsock.send(json.dumps([key.replace(" ", "%20") for key in archive.neph_keys()]))
+        except WebSocketError:
+            pass
+        return
+
     jobs = []
     while True:
         new_jobs = []
@@ -100,12 +183,5 @@ def update_status():
     if not wsock:
         abort(400, "Expected WebSocket request.")
 
-    sub = redis.pubsub()
-    sub.subscribe("zeroci_status")
-    for msg in sub.listen():
-        data = msg["data"]
-        if isinstance(data, bytes):
-            try:
-                wsock.send(data.decode())
-            except WebSocketError:
-                break
+    subscription = hub.status()
+    _send_subscription(wsock, subscription, lambda data: data.decode())
@@ -0,0 +1,72 @@
+"""Compare the streaming JUnit parser with the previous xmltodict based one.
+
+Run from the backend directory: python3 -m benchmarks.junit_parse [testcases] [output size per testcase]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import xmltodict
+
+from utils.utils import Utils
+
+
+def legacy_xml_parse(path):
+    """The previous parser, it loads the whole report then converts it to dict."""
+    with open(path, "r") as f:
+        content = xmltodict.parse(f.read(), attr_prefix="", cdata_key="content")["testsuite"]
+    result = dict(summary={"name": content["name"]}, testcases=[])
+    for key in ["tests", "errors", "failures", "skipped"]:
+        result["summary"][key] = int(content[key])
+    status_map = {"error": "errored", "failure": "failed", "skipped": "skipped"}
+    for testcase in content["testcase"]:
+        obj = dict()
+        for key in testcase.keys():
+            if key in status_map:
+                obj["status"] = status_map[key]
+                obj["details"] = dict(testcase[key])
+            else:
+                obj[key] = testcase[key]
+        obj.setdefault("status", "passed")
+        result["testcases"].append(obj)
+    return result
+
+
+def generate_report(path, testcases, output_size):
+    output = "x" * (output_size - 1) + "\n"
+    with open(path, "w") as f:
+        f.write(f'<testsuite name="bench" tests="{testcases}" errors="0" failures="{testcases // 10}" skipped="0">\n')
+        for i in range(testcases):
+            f.write(f'<testcase classname="tests.test_bench" name="test_{i}" time="0.01">')
+            if i % 10 == 0:
+                f.write(f'<failure message="assert False">{output}</failure>')
+            f.write(f"<system-out>{output}</system-out></testcase>\n")
+        f.write("</testsuite>\n")
+
+
+def measure(name, func):
+    tracemalloc.start()
+    start = time.time()
+    result = func()
+    taken = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name}: {taken:.2f} s, peak memory {peak / 1024 ** 2:.1f} MiB, {len(result['testcases'])} testcases")
+
+
+def main():
+    testcases = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    output_size = int(sys.argv[2]) if len(sys.argv) > 2 else 10 * 1024
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.xml")
+        generate_report(path, testcases, output_size)
+        print(f"report size: {os.path.getsize(path) / 1024 ** 2:.1f} MiB")
+        measure("xmltodict", lambda: legacy_xml_parse(path))
+        measure("streaming", lambda: Utils().xml_parse(path, line="pytest"))
+        measure("streaming (4 KiB texts)", lambda: Utils().xml_parse(path, line="pytest", max_text=4096))
+
+
+if __name__ == "__main__":
+    main()
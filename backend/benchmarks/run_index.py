@@ -0,0 +1,121 @@
+"""Compare the runs listing queries using the redis indexes with the previous store based ones.
+
+Runs are saved in separate benchmark models and deleted at the end.
+Run from the backend directory: python3 -m benchmarks.run_index [runs ...] (default: 10000 100000)
+"""
+import random
+import sys
+import time
+
+from models.base import Document, IndexedFactory, ModelFactory, fields
+
+BRANCHES = 20
+SUCCESS = "success"
+FAILURE = "failure"
+ERROR = "error"
+PENDING = "pending"
+REPO = "threefoldtech/bench"
+
+
+class BenchRunModel(Document):
+    timestamp = fields.Integer(required=True, indexed=True)
+    repo = fields.String(required=True)
+    branch = fields.String(required=True)
+    commit = fields.String(required=True)
+    committer = fields.String(required=True)
+    status = fields.String(required=True)
+    bin_release = fields.String()
+    triggered_by = fields.String(default="VCS Hook")
+    result = fields.List(field=fields.Typed(dict))
+
+
+class BenchRun(ModelFactory):
+    _model = IndexedFactory(
+        BenchRunModel,
+        indexes=[("repo",), ("repo", "branch"), ("status",)],
+        summary=["commit", "committer", "bin_release", "triggered_by"],
+    )
+
+
+def populate(runs):
+    start = time.time()
+    now = int(time.time()) - runs
+    testcases = [{"classname": "tests.test_bench", "name": f"test_{i}", "time": "0.01"} for i in range(50)]
+    for i in range(runs):
+        status = PENDING if i % 1000 == 0 else random.choice([SUCCESS, SUCCESS, FAILURE, ERROR])
+        run = BenchRun._model.new(
+            name=f"model{(now + i) * 10 ** 6}",
+            timestamp=now + i,
+            repo=REPO,
+            branch=f"branch_{i % BRANCHES}",
+            commit=f"{i:040x}",
+            committer="bench",
+            status=status,
+            result=[{"type": "testsuite", "status": status, "name": "bench", "content": {"testcases": testcases}}],
+        )
+        run.save()
+    print(f"saved {runs} runs in {time.time() - start:.2f} s")
+
+
+def measure(name, func, repeat=3):
+    taken = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        taken.append(time.time() - start)
+    print(f"  {name}: {min(taken) * 1000:.1f} ms")
+
+
+def compare(title, legacy, indexed):
+    print(title)
+    measure("legacy", legacy, repeat=1)
+    measure("indexed", indexed)
+
+
+def clean():
+    for name in list(BenchRun._model.list_all()):
+        BenchRun.delete(name)
+    BenchRun.rebuild_index()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    fields_ = ["status", "commit", "committer", "timestamp", "bin_release", "triggered_by"]
+    finished = {"repo": REPO, "branch": "branch_0"}
+    legacy_status = f"{ERROR} OR {FAILURE} OR {SUCCESS}"
+    for runs in sizes:
+        print(f"--- {runs} runs")
+        clean()
+        populate(runs)
+        compare(
+            "branch runs (newest 50)",
+            lambda: BenchRun.get_objects(fields=list(fields_), order_by="timestamp", asc=False, **finished),
+            lambda: BenchRun.latest(fields=list(fields_), limit=50, **finished),
+        )
+        compare(
+            "status badge",
+            lambda: BenchRun.get_objects(
+                fields=["status"], order_by="timestamp", asc=False, status=legacy_status, **finished
+            ),
+            lambda: BenchRun.latest(fields=["status"], limit=1, status=[ERROR, FAILURE, SUCCESS], **finished),
+        )
+        compare(
+            "pending check",
+            lambda: BenchRun.get_objects(fields=["status"], commit=f"{0:040x}", status=PENDING, **finished),
+            lambda: BenchRun.latest(fields=["status"], limit=1, commit=f"{0:040x}", status=PENDING, **finished),
+        )
+        compare(
+            "last result of a branch",
+            lambda: BenchRun.get_objects(fields=["result"], order_by="timestamp", asc=False, **finished)[0],
+            lambda: BenchRun.latest(fields=["result"], limit=1, **finished),
+        )
+        compare(
+            "distinct branches",
+            lambda: {obj.branch for obj in BenchRun._model.find_many(repo=REPO)[2]},
+            lambda: BenchRun.distinct("branch", repo=REPO),
+        )
+    clean()
+
+
+if __name__ == "__main__":
+    main()
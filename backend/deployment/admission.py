@@ -0,0 +1,200 @@
+import json
+import os
+import re
+import time
+from uuid import uuid4
+
+from redis import Redis
+from redis.exceptions import LockError
+
+from deployment import kube
+from utils.metrics import Metrics
+
+CAPACITY_KEY = "zeroci:admission:capacity"
+RESERVATIONS_KEY = "zeroci:admission:reservations"
+LOCK_KEY = "zeroci:admission:lock"
+CAPACITY_TTL = 10
+RESERVATION_TTL = 600
+WAIT_TIMEOUT = int(os.environ.get("ADMISSION_TIMEOUT", 1800))
+POLL_INTERVAL = 2
+RESOURCES = ["cpu", "memory"]
+SUFFIXES = {
+    "Ki": 2 ** 10,
+    "Mi": 2 ** 20,
+    "Gi": 2 ** 30,
+    "Ti": 2 ** 40,
+    "n": 1e-9,
+    "u": 1e-6,
+    "m": 1e-3,
+    "": 1,
+    "k": 1e3,
+    "M": 1e6,
+    "G": 1e9,
+    "T": 1e12,
+}
+QUANTITY = re.compile(r"^([0-9]+(?:\.[0-9]+)?)(Ki|Mi|Gi|Ti|n|u|m|k|M|G|T)?$")
+
+r = Redis()
+metrics = Metrics("admission")
+
+
+def parse_quantity(value):
+    """Convert kubernetes quantity to a number, cpu in cores and memory in bytes.
+
+    :raises ValueError: if the quantity is invalid.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = QUANTITY.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid quantity {value}")
+    return float(match.group(1)) * SUFFIXES[match.group(2) or ""]
+
+
+class Admission:
+    """Hold pods' creation until their resources requests fit in the free capacity of the cluster.
+
+    The free capacity is the namespace's resource quota if there is one, limited by the allocatable resources of the
+    ready nodes minus the requests of their pods. Admitted pods reserve their requests in redis until they are
+    created and counted by kubernetes, so workers admitting pods at the same time don't overcommit the nodes.
+    A pod waiting more than `ADMISSION_TIMEOUT` seconds is admitted anyway, the run keeps its worker while waiting.
+    Claimed warm pods don't go through admission, they were created and counted by kubernetes before.
+    """
+
+    def __init__(self):
+        self.enabled = not os.environ.get("ADMISSION_DISABLED")
+        self.namespace = os.environ.get("NAMESPACE", "default")
+
+    def _quota_free(self, api):
+        free = {}
+        for quota in api.list_namespaced_resource_quota(namespace=self.namespace).items:
+            hard = quota.status.hard or {}
+            used = quota.status.used or {}
+            for resource in RESOURCES:
+                for name in [f"requests.{resource}", resource]:
+                    if name in hard:
+                        value = parse_quantity(hard[name]) - parse_quantity(used.get(name, 0))
+                        free[resource] = min(free.get(resource, value), value)
+        return free
+
+    def _nodes_free(self, api):
+        free = dict.fromkeys(RESOURCES, 0.0)
+        nodes = set()
+        for node in api.list_node().items:
+            if node.spec.unschedulable:
+                continue
+            conditions = node.status.conditions or []
+            if not any(condition.type == "Ready" and condition.status == "True" for condition in conditions):
+                continue
+            nodes.add(node.metadata.name)
+            for resource in RESOURCES:
+                free[resource] += parse_quantity((node.status.allocatable or {}).get(resource, 0))
+
+        pods = api.list_pod_for_all_namespaces(field_selector="status.phase!=Succeeded,status.phase!=Failed")
+        for pod in pods.items:
+            # pending pods aren't on a node yet but they will take from the capacity.
+            if pod.spec.node_name and pod.spec.node_name not in nodes:
+                continue
+            for container in pod.spec.containers:
+                requests = (container.resources and container.resources.requests) or {}
+                for resource in RESOURCES:
+                    free[resource] -= parse_quantity(requests.get(resource, 0))
+        return free
+
+    def capacity(self):
+        """Get the free capacity of the cluster, it is cached for a few seconds.
+
+        :return: {"cpu": cores, "memory": bytes}
+        :return type: dict
+        """
+        cached = r.get(CAPACITY_KEY)
+        if cached:
+            return json.loads(cached)
+        api = kube.core_api()
+        free = self._nodes_free(api)
+        for resource, value in self._quota_free(api).items():
+            free[resource] = min(free[resource], value)
+        r.set(CAPACITY_KEY, json.dumps(free), ex=CAPACITY_TTL)
+        metrics.set("free_cpu", free["cpu"])
+        metrics.set("free_memory", free["memory"])
+        return free
+
+    def _reserved(self):
+        reserved = dict.fromkeys(RESOURCES, 0.0)
+        for id, data in r.hgetall(RESERVATIONS_KEY).items():
+            reservation = json.loads(data)
+            if reservation["expires"] < time.time():
+                r.hdel(RESERVATIONS_KEY, id)
+                continue
+            for resource in RESOURCES:
+                reserved[resource] += reservation[resource]
+        return reserved
+
+    def _reserve(self, requests, force=False):
+        """Reserve the requests if they fit in the free capacity, it is called while holding the lock.
+
+        :param force: reserve them even if they don't fit.
+        :return: reservation id or None if they don't fit.
+        """
+        capacity = self.capacity()
+        reserved = self._reserved()
+        fits = all(requests.get(res, 0) <= capacity[res] - reserved[res] for res in RESOURCES)
+        if not (fits or force):
+            return None
+        id = str(uuid4())
+        reservation = {res: requests.get(res, 0) for res in RESOURCES}
+        reservation["expires"] = time.time() + RESERVATION_TTL
+        r.hset(RESERVATIONS_KEY, id, json.dumps(reservation))
+        return id
+
+    def admit(self, requests, control=None):
+        """Wait until the requests fit in the free capacity and reserve them.
+
+        :param requests: {"cpu": cores, "memory": bytes} needed by the pod.
+        :type requests: dict
+        :param control: run control of the pod's job, waiting stops once it stops the run.
+        :type control: RunControl
+        :return: reservation id to be released once the pod is created, or None if admission is disabled or the
+        run has been stopped.
+        """
+        if not self.enabled:
+            return None
+        start = time.time()
+        while True:
+            if control and control.check():
+                metrics.incr("stopped")
+                return None
+            timed_out = time.time() - start > WAIT_TIMEOUT
+            lock = r.lock(LOCK_KEY, timeout=30)
+            if not lock.acquire(blocking_timeout=POLL_INTERVAL):
+                # other workers are admitting their pods.
+                metrics.incr("lock_waits")
+                if timed_out:
+                    metrics.incr("timeouts")
+                    return None
+                continue
+            try:
+                id = self._reserve(requests, force=timed_out)
+            except Exception:
+                # capacity can't be known, don't block the deployments.
+                metrics.incr("errors")
+                return None
+            finally:
+                try:
+                    lock.release()
+                except LockError:
+                    # the lock expired, the reservation is already stored.
+                    pass
+            if id:
+                metrics.incr("timeouts" if timed_out else "admitted")
+                metrics.timing("wait", time.time() - start)
+                return id
+            time.sleep(POLL_INTERVAL)
+
+    def release(self, id):
+        """Release a reservation, the pod's requests are counted by kubernetes from now on.
+        """
+        if not id:
+            return
+        r.hdel(RESERVATIONS_KEY, id)
+        r.delete(CAPACITY_KEY)
@@ -0,0 +1,154 @@
+import os
+import re
+import shlex
+import time
+
+from redis import Redis
+
+from deployment.container import ARTIFACTS_DIR
+from utils.metrics import Metrics
+
+CACHE_DIR = "/zeroci/cache"
+CACHE_SIZE = int(os.environ.get("CACHE_SIZE", 10240)) * 1024 ** 2  # bytes
+ARCHIVE_NAME = "zeroci-cache.tgz"
+LOCK_KEY = "zeroci:cache:lock"
+CHECKSUM = re.compile(r"\{checksum:([^}]+)\}")
+
+r = Redis()
+metrics = Metrics("cache")
+
+
+class DependencyCache:
+    """Archive of a job's dependencies paths stored on ZeroCI's host under a key rendered from the job's `cache`.
+
+    The key template can contain `{checksum:<file>}` which is replaced with the checksum of this file in the
+    repository, so the cache is rebuilt when the dependencies change. Archives are evicted least recently used
+    first when they exceed `CACHE_SIZE` MiB.
+    """
+
+    def __init__(self, owner, job_name, cache, repo_path):
+        self.dir = os.path.join(CACHE_DIR, owner, job_name)
+        self.key_template = cache["key"]
+        self.paths = cache["paths"]
+        self.repo_path = repo_path
+        self.remote_path = os.path.join(ARTIFACTS_DIR, ARCHIVE_NAME)
+        self.key = None
+        self.hit = False
+        self.report = []
+
+    def _render_key(self, container):
+        key = self.key_template
+        for path in set(CHECKSUM.findall(key)):
+            cmd = f"cd {shlex.quote(self.repo_path)} && sha256sum {shlex.quote(path)}"
+            response = container.ssh_command(cmd=cmd)
+            if response.returncode or not response.stdout.split():
+                return None
+            key = key.replace(f"{{checksum:{path}}}", response.stdout.split()[0][:16])
+        return re.sub(r"[^\w.-]", "_", key)
+
+    def _archive_path(self):
+        return os.path.join(self.dir, f"{self.key}.tgz")
+
+    def _quote_path(self, path):
+        if path.startswith("~/"):
+            return '"$HOME"/' + shlex.quote(path[2:])
+        return shlex.quote(path)
+
+    def _stopped(self, container):
+        """Check the run's control, the cache transfers are skipped once the run is cancelled or timed out.
+        """
+        if container.control and container.control.check():
+            self.report.append(f"Cache is skipped: {container.control.message}")
+            return True
+        return False
+
+    def restore(self, container):
+        """Extract the archive matching the job's key in the test container if it exists.
+        """
+        if self._stopped(container):
+            return
+        start = time.time()
+        self.key = self._render_key(container)
+        if not self.key:
+            self.report.append("Couldn't compute the cache key, cache is disabled for this job")
+            return
+        archive_path = self._archive_path()
+        if not os.path.exists(archive_path):
+            metrics.incr("misses")
+            self.report.append(f"Cache miss for key {self.key}")
+            return
+        # mark it as recently used.
+        os.utime(archive_path)
+        size = os.path.getsize(archive_path)
+        if container.ssh_set_remote_file(remote_path=self.remote_path, local_path=archive_path):
+            cmd = f"tar -xzf {self.remote_path} -C / && rm -f {self.remote_path}"
+            response = container.execute_command(cmd=cmd, id="", verbose=False)
+            if not response.returncode:
+                self.hit = True
+                duration = time.time() - start
+                metrics.incr("hits")
+                metrics.timing("restore", duration)
+                self.report.append(f"Cache hit for key {self.key}, restored {size} bytes in {duration:.2f}s")
+                return
+        metrics.incr("restore_errors")
+        self.report.append(f"Couldn't restore the cache of key {self.key}")
+
+    def save(self, container):
+        """Archive the cache paths from the test container and store them on the host, skipped on cache hit.
+        """
+        if not self.key or self.hit or self._stopped(container):
+            return
+        start = time.time()
+        paths = " ".join(self._quote_path(path) for path in self.paths)
+        cmd = f"""cd {shlex.quote(self.repo_path)}
+set --
+for p in {paths}; do
+  case "$p" in /*) ;; *) p="$PWD/$p" ;; esac
+  if [ -e "$p" ]; then set -- "$@" "${{p#/}}"; fi
+done
+[ $# -gt 0 ] || exit 3
+cd /
+tar -czf {self.remote_path} "$@"
+"""
+        response = container.execute_command(cmd=cmd, id="", verbose=False)
+        if response.returncode == 3:
+            self.report.append("Cache paths are not found, nothing is saved")
+            return
+        archive_path = self._archive_path()
+        if response.returncode or not container.fetch_file(self.remote_path, archive_path, remove=True):
+            metrics.incr("save_errors")
+            self.report.append(f"Couldn't save the cache of key {self.key}")
+            return
+        duration = time.time() - start
+        metrics.timing("save", duration)
+        self.report.append(
+            f"Cache saved for key {self.key}, {os.path.getsize(archive_path)} bytes in {duration:.2f}s"
+        )
+        self._evict()
+
+    def _evict(self):
+        with r.lock(LOCK_KEY, timeout=300, blocking_timeout=300):
+            archives = []
+            for root, dirs, files in os.walk(CACHE_DIR):
+                # skip the temporary directories of the saves in progress.
+                dirs[:] = [name for name in dirs if not name.startswith("tmp")]
+                for name in files:
+                    if not name.endswith(".tgz"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    archives.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in archives)
+            for _, size, path in sorted(archives):
+                if total <= CACHE_SIZE:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                metrics.incr("evictions")
+            metrics.set("size", total)
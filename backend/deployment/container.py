@@ -1,17 +1,52 @@
 import os
 import random
+import shlex
+import shutil
+import tempfile
 import time
 
-import paramiko
-import redis
 import yaml
 
-from kubernetes import client, config
+from deployment import kube
+from deployment.admission import RESOURCES, Admission, parse_quantity
+from deployment.reaper import OWNER, OWNER_LABEL, RUN_LABEL, WARM_LABEL, Reaper
+from deployment.ssh_pool import SSHPool
+from deployment.ssh_pool import metrics as ssh_metrics
+from deployment.transfer import FileTransfer
+from deployment.warm_pool import WARM_REPO_PATH, WARM_SHELL, WarmPool
+from kubernetes import client, watch
 from kubernetes.stream import stream
+from utils.log_sink import LogSink
+from utils.metrics import Metrics
 from utils.utils import Utils
 
 TIMEOUT = 120
 RETRIES = 5
+READ_TIMEOUT = 5
+CONTROL_INTERVAL = 1
+WATCH_INTERVAL = 5
+BIN_DIR = "/zeroci/bin"
+ARTIFACTS_DIR = "/zeroci/artifacts"
+SSH_RETRIES = 20
+FAILURE_REASONS = [
+    "ImagePullBackOff",
+    "ErrImagePull",
+    "InvalidImageName",
+    "CrashLoopBackOff",
+    "CreateContainerConfigError",
+]
+
+TEST_RESOURCES = {"requests": {"memory": "300Mi"}, "limits": {"memory": "2000Mi"}}
+HELPER_RESOURCES = {"requests": {"memory": "150Mi"}, "limits": {"memory": "300Mi"}}
+
+deploy_metrics = Metrics("deployment")
+admission = Admission()
+reaper = Reaper()
+warm_pool = WarmPool()
+
+
+class DeploymentError(Exception):
+    """Raised when a pod can never be ready, so there is no need to retry."""
 
 
 class Complete_Execution:
@@ -24,9 +59,17 @@ class Complete_Execution:
 
 
 class Container(Utils):
-    def __init__(self):
+    def __init__(self, run_id=None, control=None):
         super().__init__()
+        self.run_id = run_id
+        self.control = control
+        self.warm = False
         self.shell_bin = "/bin/sh"
+        self.ssh_pool = SSHPool()
+        self.error = None
+        # run env of a warm pod, it was created before the run so its commands get it through `env`.
+        self.exec_env = []
+        self.repo_mount = None
 
     def ssh_command(self, cmd, ip=None, port=22):
         """Execute a command on a remote machine using ssh.
@@ -41,37 +84,53 @@ class Container(Utils):
         if not ip:
             ip = self.name
         out = ""
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.MissingHostKeyPolicy())
         try:
-            client.connect(hostname=ip, port=port, timeout=30)
+            session = self.ssh_pool.get(host=ip, port=port)
         except:
             out = "Couldn't ssh on the helper container, maybe the test broke the ssh or the helper container become unreachable"
             rc = 1
             return Complete_Execution(rc, out)
-        _, stdout, _ = client.exec_command(cmd, timeout=600, get_pty=True)
-        while not stdout.channel.exit_status_ready():
-            try:
-                output = stdout.readline()
-                out += output
-            except:
+        start = time.time()
+        _, stdout, _ = session.exec_command(cmd, get_pty=True)
+        channel = stdout.channel
+        output = b""
+        rc = None
+        last_output = time.time()
+        while not channel.exit_status_ready() or channel.recv_ready():
+            if channel.recv_ready():
+                output += channel.recv(65536)
+                last_output = time.time()
+                continue
+            if self.control and self.control.check():
+                msg = f"\n{self.control.message}"
+            elif time.time() - last_output > 600:
                 msg = "Timeout Exceeded 10 mins"
-                out += msg
-                stdout.channel.close()
-        rc = stdout.channel.recv_exit_status()
+            else:
+                time.sleep(0.1)
+                continue
+            output += msg.encode()
+            channel.close()
+            rc = 124
+            break
+        if rc is None:
+            rc = channel.recv_exit_status()
+        out += output.decode(errors="replace")
+        ssh_metrics.timing("command", time.time() - start)
 
         return Complete_Execution(rc, out)
 
+    def _check_transfer(self, transferred, total):
+        """Stop a file copy once the run is cancelled or timed out.
+        """
+        if self.control and self.control.check():
+            raise InterruptedError(self.control.message)
+
     def ssh_get_remote_file(self, remote_path, local_path, ip=None, port=22):
         if not ip:
             ip = self.name
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.MissingHostKeyPolicy())
-        client.connect(hostname=ip, port=port, timeout=30)
-        ftp = client.open_sftp()
         try:
-            ftp.get(remote_path, local_path)
-            ftp.close()
+            ftp = self.ssh_pool.get(host=ip, port=port).sftp()
+            ftp.get(remote_path, local_path, callback=self._check_transfer)
             return True
         except:
             return False
@@ -79,22 +138,13 @@ class Container(Utils):
     def ssh_set_remote_file(self, remote_path, local_path, ip=None, port=22):
         if not ip:
             ip = self.name
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.MissingHostKeyPolicy())
-        client.connect(hostname=ip, port=port, timeout=30)
-        ftp = client.open_sftp()
         try:
-            ftp.put(local_path, remote_path)
-            ftp.close()
+            ftp = self.ssh_pool.get(host=ip, port=port).sftp()
+            ftp.put(local_path, remote_path, callback=self._check_transfer)
             return True
         except:
             return False
 
-    def redis_push(self, id, content, verbose=True):
-        if verbose:
-            r = redis.Redis()
-            r.rpush(id, content)
-
     def execute_command(self, cmd, id, verbose=True):
         """Execute a command on a remote machine using ssh.
 
@@ -106,11 +156,16 @@ class Container(Utils):
             command = [self.shell_bin, "-ce", cmd]
         else:
             command = [self.shell_bin, cmd]
+        if self.exec_env:
+            command = ["env", *self.exec_env, *command]
         out = ""
         rc = None
+        sink = LogSink(key=id, verbose=verbose)
+        if self.control and self.control.check():
+            return Complete_Execution(124, self.control.message)
         try:
             response = stream(
-                self.client.connect_get_namespaced_pod_exec,
+                kube.exec_api().connect_get_namespaced_pod_exec,
                 name=self.name,
                 container=self.test_container_name,
                 namespace=self.namespace,
@@ -123,52 +178,106 @@ class Container(Utils):
             )
         except:
             out += "Couldn't run on the testing container, container become unreachable"
-            self.redis_push(id, out, verbose=verbose)
+            sink.write(out)
+            sink.flush()
             rc = 137
             return Complete_Execution(rc, out)
 
+        last_output = time.time()
         while response.is_open():
-            start = time.time()
+            # wake up in time to flush the buffered logs even if the command has no new output.
+            timeout = sink.time_to_flush()
+            if timeout is None:
+                timeout = READ_TIMEOUT
+            if self.control:
+                timeout = min(timeout, CONTROL_INTERVAL)
             try:
-                content = response.read_stdout(timeout=600)
+                content = response.read_stdout(timeout=timeout)
             except:
                 msg = "\nConnectionError: Couldn't execute cmd on the runner"
-                self.redis_push(id, msg, verbose=verbose)
+                sink.write(msg)
                 out += msg
                 rc = 124
                 break
-            end = time.time()
-            time_taken = end - start
             if content:
-                self.redis_push(id, content, verbose=verbose)
+                sink.write(content)
                 out += content
-            elif time_taken > 590:
+                last_output = time.time()
+            elif time.time() - last_output > 590:
                 msg = "\nTimeout exceeded 10 mins with no output"
-                self.redis_push(id, msg, verbose=verbose)
+                sink.write(msg)
+                out += msg
+                rc = 124
+                response.close()
+                break
+            if self.control and self.control.check():
+                msg = f"\n{self.control.message}"
+                sink.write(msg)
                 out += msg
                 rc = 124
                 response.close()
                 break
+            sink.flush_if_due()
 
         if not rc:
             rc = response.returncode
         if rc == 137:
             msg = "Runner expired (job takes more than 1 hour)"
-            self.redis_push(id, msg, verbose=verbose)
+            sink.write(msg)
             out += msg
+        sink.flush()
 
         return Complete_Execution(rc, out)
 
-    def get_remote_file(self, remote_path, local_path):
-        response = self.execute_command(f"cat {remote_path}", id="", verbose=False)
-        if not response.returncode:
-            self.write_file(text=response.stdout, file_path=local_path)
+    def _is_shared(self, path):
+        """Check if the path is on a volume shared between the test and helper containers.
+        """
+        shared_dirs = [BIN_DIR, ARTIFACTS_DIR, self.repo_mount]
+        return any(path.startswith(shared_dir.rstrip("/") + "/") for shared_dir in shared_dirs if shared_dir)
+
+    def fetch_files(self, paths, local_dir, remove=False):
+        """Copy files matching paths or globs from the shared volumes as one compressed and checksummed archive.
+
+        :param paths: absolute paths or globs on the pod.
+        :type paths: list
+        :param local_dir: directory to copy the files to, pod paths are kept under it.
+        :type local_dir: str
+        :param remove: remove the files from the pod after being copied.
+        :type remove: bool
+        :return: {remote path: local path} of copied files.
+        :return type: dict
+        """
+        session = self.ssh_pool.get(host=self.name)
+        return FileTransfer(session, control=self.control).fetch(paths=paths, local_dir=local_dir, remove=remove)
+
+    def fetch_file(self, remote_path, local_path, remove=False):
+        """Copy one file from the pod, it is copied first to the artifacts volume if it isn't on a shared volume.
+
+        :return: bool (True: if the file is copied).
+        """
+        if not self._is_shared(remote_path):
+            response = self.execute_command(f"cp {remote_path} {ARTIFACTS_DIR}/", id="", verbose=False)
+            if response.returncode:
+                return False
+            remote_path = os.path.join(ARTIFACTS_DIR, os.path.basename(remote_path))
+            remove = True
+        local_dir = os.path.dirname(local_path)
+        os.makedirs(local_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=local_dir)
+        try:
+            files = self.fetch_files(paths=[remote_path], local_dir=tmp_dir, remove=remove)
+            if remote_path not in files:
+                return False
+            os.replace(files[remote_path], local_path)
             return True
-        return False
+        except Exception:
+            return False
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    def create_pod(self, env, prerequisites, repo_path):
+    def create_pod(self, env, prerequisites, repo_path, lifetime=3600):
         # zeroci vol
-        bin_mount_path = "/zeroci/bin"
+        bin_mount_path = BIN_DIR
         bin_vol_name = "bin-path"
         bin_vol = client.V1Volume(name=bin_vol_name, empty_dir={})
         bin_vol_mount = client.V1VolumeMount(mount_path=bin_mount_path, name=bin_vol_name)
@@ -178,21 +287,26 @@ class Container(Utils):
         repo_vol = client.V1Volume(name=repo_vol_name, empty_dir={})
         repo_vol_mount = client.V1VolumeMount(mount_path=repo_mount_path, name=repo_vol_name)
 
-        vol_mounts = [bin_vol_mount, repo_vol_mount]
-        vols = [bin_vol, repo_vol]
+        # artifacts vol, files are copied out of the pod through it
+        artifacts_vol_name = "artifacts-path"
+        artifacts_vol = client.V1Volume(name=artifacts_vol_name, empty_dir={})
+        artifacts_vol_mount = client.V1VolumeMount(mount_path=ARTIFACTS_DIR, name=artifacts_vol_name)
+
+        vol_mounts = [bin_vol_mount, repo_vol_mount, artifacts_vol_mount]
+        vols = [bin_vol, repo_vol, artifacts_vol]
+        self.repo_mount = repo_path
         ports = client.V1ContainerPort(container_port=22)
         non_interactive = client.V1EnvVar(name="DEBIAN_FRONTEND", value="noninteractive")
         redis_server = os.environ.get("REDIS", "redis")
         redis_server = client.V1EnvVar(name="NEPH_REDIS", value=f"redis://{redis_server}:6379")
         env.extend([non_interactive, redis_server])
         if self.shell_bin in ["/bin/bash", "/bin/sh"]:
-            commands = [self.shell_bin, "-ce", "env | grep _ >> /etc/environment && sleep 3600"]
+            commands = [self.shell_bin, "-ce", f"env | grep _ >> /etc/environment && sleep {lifetime}"]
         else:
-            commands = [self.shell_bin, "env | grep _ >> /etc/environment && sleep 3600"]
+            commands = [self.shell_bin, f"env | grep _ >> /etc/environment && sleep {lifetime}"]
 
-        limits = {"memory": "2000Mi"}
-        requests = {"memory": "300Mi"}
-        resources = client.V1ResourceRequirements(limits=limits, requests=requests)
+        test_resources = self._test_resources(prerequisites)
+        resources = client.V1ResourceRequirements(limits=test_resources["limits"], requests=test_resources["requests"])
         test_container = client.V1Container(
             name=self.test_container_name,
             image=prerequisites["image_name"],
@@ -202,9 +316,9 @@ class Container(Utils):
             resources=resources,
         )
         ssh_key = self.load_ssh_key()
-        limits = {"memory": "300Mi"}
-        requests = {"memory": "150Mi"}
-        resources = client.V1ResourceRequirements(limits=limits, requests=requests)
+        resources = client.V1ResourceRequirements(
+            limits=HELPER_RESOURCES["limits"], requests=HELPER_RESOURCES["requests"]
+        )
         helper_container = client.V1Container(
             name=self.helper_container_name,
             image="ahmedhanafy725/ubuntu",
@@ -212,71 +326,246 @@ class Container(Utils):
                 "/bin/sh",
                 "-ce",
                 f"echo {ssh_key} > /root/.ssh/authorized_keys && cp /usr/local/bin/* /zeroci/bin/ \
-                && service ssh start && sleep 3600",
+                && service ssh start && sleep {lifetime}",
             ],
             env=[non_interactive],
             ports=[ports],
             volume_mounts=vol_mounts,
             resources=resources,
+            readiness_probe=client.V1Probe(tcp_socket=client.V1TCPSocketAction(port=22), period_seconds=1),
         )
         spec = client.V1PodSpec(
             volumes=vols, containers=[test_container, helper_container], hostname=self.name, restart_policy="Never",
         )
-        meta = client.V1ObjectMeta(name=self.name, namespace=self.namespace, labels={"app": self.name})
+        meta = client.V1ObjectMeta(name=self.name, namespace=self.namespace, labels=self._labels())
         pod = client.V1Pod(api_version="v1", kind="Pod", metadata=meta, spec=spec)
         self.client.create_namespaced_pod(body=pod, namespace=self.namespace)
 
+    def _labels(self):
+        labels = {"app": self.name, OWNER_LABEL: OWNER}
+        if self.run_id:
+            labels[RUN_LABEL] = self.run_id
+        if self.warm:
+            labels[WARM_LABEL] = "true"
+        return labels
+
+    def _test_resources(self, prerequisites):
+        """Merge the job's resources with the default ones of the test container.
+        """
+        resources = prerequisites.get("resources") or {}
+        requests = {**TEST_RESOURCES["requests"], **resources.get("requests", {})}
+        if "limits" in resources:
+            limits = dict(resources["limits"])
+            # the default request shouldn't be higher than the job's limit.
+            for resource, value in limits.items():
+                if resource not in resources.get("requests", {}) and resource in requests:
+                    if parse_quantity(requests[resource]) > parse_quantity(value):
+                        requests[resource] = value
+        else:
+            limits = dict(TEST_RESOURCES["limits"])
+            # the default limit shouldn't be lower than the job's request.
+            for resource, value in requests.items():
+                if resource in limits and parse_quantity(value) > parse_quantity(limits[resource]):
+                    limits[resource] = value
+        return {"requests": requests, "limits": limits}
+
+    def pod_requests(self, prerequisites):
+        """Get the resources requested by the job's pod, a resource with only a limit is requested as much.
+
+        :return: {"cpu": cores, "memory": bytes}
+        :return type: dict
+        """
+        total = dict.fromkeys(RESOURCES, 0.0)
+        for resources in [self._test_resources(prerequisites), HELPER_RESOURCES]:
+            for resource in RESOURCES:
+                value = resources["requests"].get(resource, resources["limits"].get(resource, 0))
+                total[resource] += parse_quantity(value)
+        return total
+
     def create_service(self):
         port = client.V1ServicePort(name="ssh", port=22)
         spec = client.V1ServiceSpec(ports=[port], selector={"app": self.name})
-        meta = client.V1ObjectMeta(name=self.name, namespace=self.namespace, labels={"app": self.name})
+        meta = client.V1ObjectMeta(name=self.name, namespace=self.namespace, labels=self._labels())
         service = client.V1Service(api_version="v1", kind="Service", metadata=meta, spec=spec)
         self.client.create_namespaced_service(body=service, namespace=self.namespace)
 
+    def attach(self, name):
+        """Point this object to an existing deployment.
+
+        :param name: pod and service name.
+        :type name: str
+        """
+        self.client = kube.core_api()
+        self.name = name
+        self.test_container_name = f"test-{self.name}"
+        self.helper_container_name = f"helper-{self.name}"
+        self.namespace = os.environ.get("NAMESPACE", "default")
+
+    def create_warm(self, image, lifetime):
+        """Create a pod for the warm pool without waiting for it, the run env is injected when it is claimed.
+
+        :return: pod name.
+        :return type: str
+        """
+        self.attach(self.random_string())
+        self.warm = True
+        self.shell_bin = WARM_SHELL
+        self.create_pod(env=[], prerequisites={"image_name": image}, repo_path=WARM_REPO_PATH, lifetime=lifetime)
+        self.create_service()
+        return self.name
+
+    def _claim_warm(self, env, prerequisites):
+        if prerequisites.get("resources"):
+            # warm pods are created with the default resources.
+            return False
+        name = warm_pool.claim(prerequisites["image_name"], shell_bin=self.shell_bin)
+        warm_pool.refill_async()
+        if not name:
+            return False
+        self.attach(name)
+        self.repo_mount = WARM_REPO_PATH
+        try:
+            # label it with the run, so the reaper doesn't take it as an orphan of the pool.
+            labels = {RUN_LABEL: self.run_id, WARM_LABEL: None}
+            self.client.patch_namespaced_pod(name=name, namespace=self.namespace, body={"metadata": {"labels": labels}})
+            self.wait_for_container()
+            self.wait_for_ssh()
+        except Exception:
+            self.delete()
+            return False
+        self.exec_env = [f"{var.name}={var.value or ''}" for var in env]
+        # add the run env to /etc/environment as a cold pod does when it starts.
+        cmd = "".join(f"echo {shlex.quote(var)} >> /etc/environment\n" for var in self.exec_env)
+        if cmd and self.execute_command(cmd, id="", verbose=False).returncode:
+            self.exec_env = []
+            self.delete()
+            return False
+        return True
+
     def deploy(self, env, prerequisites, repo_path):
-        """Deploy a container on kubernetes cluster.
+        """Deploy a container on kubernetes cluster, a warm pod is used if there is one.
 
         :param prerequisites: list of prerequisites needed.
         :type prerequisites: list
         :return: bool (True: if virtual machine is created).
         """
-        config.load_incluster_config()
-        self.client = client.CoreV1Api()
-        self.name = self.random_string()
-        self.test_container_name = f"test-{self.name}"
-        self.helper_container_name = f"helper-{self.name}"
-        self.namespace = os.environ.get("NAMESPACE", "default")
+        self.error = None
+        self.exec_env = []
         if prerequisites.get("shell_bin"):
             self.shell_bin = prerequisites["shell_bin"]
-        for _ in range(RETRIES):
-            try:
-                self.create_pod(env=env, prerequisites=prerequisites, repo_path=repo_path)
-                self.create_service()
-                self.wait_for_container()
-                break
-            except:
-                self.delete()
-        else:
+        if self._stopped():
             return False
+        if self._claim_warm(env=env, prerequisites=prerequisites):
+            return True
+        # wait for the cluster to have room for the pod, so it isn't pending during the readiness timeout.
+        reservation = admission.admit(self.pod_requests(prerequisites), control=self.control)
+        try:
+            for _ in range(RETRIES):
+                if self._stopped():
+                    return False
+                # a new name every attempt, the failed pod is still being deleted in the background.
+                self.attach(self.random_string())
+                try:
+                    self.create_pod(env=env, prerequisites=prerequisites, repo_path=repo_path)
+                    self.create_service()
+                    self.wait_for_container()
+                    # open the ssh session once, it will be reused by all the job's steps.
+                    self.wait_for_ssh()
+                    break
+                except DeploymentError as e:
+                    # retrying won't help, e.g. the image doesn't exist.
+                    self.error = str(e)
+                    self.delete()
+                    return False
+                except Exception as e:
+                    self.error = str(e)
+                    self.delete()
+            else:
+                return False
+        finally:
+            admission.release(reservation)
         return True
 
+    def _stopped(self):
+        if self.control and self.control.check():
+            self.error = self.control.message
+            return True
+        return False
+
+    def _pod_failure(self, pod):
+        """Return the reason that prevents the pod from ever being ready or None.
+        """
+        for condition in pod.status.conditions or []:
+            if condition.type == "PodScheduled" and condition.status == "False" and condition.reason == "Unschedulable":
+                return f"Pod is unschedulable: {condition.message}"
+        for status in pod.status.container_statuses or []:
+            waiting = status.state.waiting
+            if waiting and waiting.reason in FAILURE_REASONS:
+                return f"{status.name}: {waiting.reason}: {waiting.message}"
+            terminated = status.state.terminated
+            if terminated:
+                return f"{status.name}: exited with code {terminated.exit_code} ({terminated.reason})"
+        if pod.status.phase in ["Failed", "Succeeded"]:
+            return f"Pod phase is {pod.status.phase}: {pod.status.reason}"
+        return None
+
+    def _pod_ready(self, pod):
+        statuses = pod.status.container_statuses or []
+        if len(statuses) != len(pod.spec.containers):
+            return False
+        return all(status.ready for status in statuses)
+
     def wait_for_container(self):
-        for _ in range(TIMEOUT):
-            time.sleep(1)
-            container_status = self.client.read_namespaced_pod_status(namespace=self.namespace, name=self.name)
-            status = container_status.status.container_statuses[0]
-            if status.ready:
-                time.sleep(5)
-                break
+        """Watch the pod until all of its containers are ready.
+
+        :raises DeploymentError: if the pod can't be ready.
+        :raises TimeoutError: if the pod isn't ready in time.
+        """
+        start = time.time()
+        while time.time() - start < TIMEOUT:
+            # the watch is opened again every few seconds to check if the run has been stopped.
+            if self.control and self.control.check():
+                raise DeploymentError(self.control.message)
+            pod_watch = watch.Watch()
+            try:
+                for event in pod_watch.stream(
+                    self.client.list_namespaced_pod,
+                    namespace=self.namespace,
+                    field_selector=f"metadata.name={self.name}",
+                    timeout_seconds=max(1, min(WATCH_INTERVAL, int(TIMEOUT - (time.time() - start)))),
+                ):
+                    pod = event["object"]
+                    if event["type"] == "DELETED":
+                        raise DeploymentError("Pod has been deleted before being ready")
+                    reason = self._pod_failure(pod)
+                    if reason:
+                        raise DeploymentError(reason)
+                    if self._pod_ready(pod):
+                        deploy_metrics.timing("ready", time.time() - start)
+                        return
+            finally:
+                pod_watch.stop()
+        deploy_metrics.incr("ready_timeouts")
+        raise TimeoutError(f"Pod isn't ready after {TIMEOUT} seconds")
+
+    def wait_for_ssh(self):
+        """Open the ssh session, the service endpoint may take a moment to follow the pod readiness.
+        """
+        for _ in range(SSH_RETRIES):
+            if self.control and self.control.check():
+                raise DeploymentError(self.control.message)
+            try:
+                return self.ssh_pool.get(host=self.name)
+            except Exception:
+                time.sleep(0.5)
+        raise TimeoutError("sshd on the helper container doesn't answer")
 
     def delete(self):
-        """Delete the container after finishing test.
+        """Delete the container after finishing test, it is deleted in the background by the reaper.
         """
-        try:
-            self.client.delete_namespaced_pod(name=self.name, namespace=self.namespace)
-            self.client.delete_namespaced_service(name=self.name, namespace=self.namespace)
-        except:
-            pass
+        self.ssh_pool.close()
+        if getattr(self, "name", None):
+            reaper.delete(name=self.name, namespace=self.namespace)
 
     def run_test(self, run_cmd, id):
         """Run test command and get the result as xml file if the running command is following junit otherwise result will be log.
@@ -289,16 +578,21 @@ class Container(Utils):
         :type env: dict
         :return: path to xml file if exist and subprocess object containing (returncode, stdout, stderr)
         """
-        response = self.execute_command(run_cmd, id=id)
-        file_path = "/zeroci/xml/{}.xml".format(self.random_string())
         remote_path = "/test.xml"
-        copied = self.get_remote_file(remote_path=remote_path, local_path=file_path)
-        if copied:
-            file_path = file_path
-            delete_cmd = f"rm -f {remote_path}"
-            self.execute_command(delete_cmd, id=id)
+        artifact_path = os.path.join(ARTIFACTS_DIR, "test.xml")
+        move_cmd = f"mv -f {remote_path} {artifact_path} 2>/dev/null || true"
+        if self.shell_bin in ["/bin/bash", "/bin/sh"]:
+            # move the result to the artifacts volume when the command exits, so no extra exec is needed.
+            response = self.execute_command(f"trap '{move_cmd}' EXIT\n{run_cmd}", id=id)
         else:
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            response = self.execute_command(run_cmd, id=id)
+            self.execute_command(move_cmd, id=id, verbose=False)
+        file_path = "/zeroci/xml/{}.xml".format(self.random_string())
+        copied = self.fetch_file(remote_path=artifact_path, local_path=file_path, remove=True)
+        if not copied and self.shell_bin in ["/bin/bash", "/bin/sh"]:
+            # the command may have replaced the EXIT trap with its own.
+            self.execute_command(move_cmd, id=id, verbose=False)
+            copied = self.fetch_file(remote_path=artifact_path, local_path=file_path, remove=True)
+        if not copied:
             file_path = None
         return response, file_path
@@ -0,0 +1,92 @@
+import functools
+import os
+import threading
+import time
+
+from kubernetes import client, config
+
+from utils.metrics import Metrics
+
+POOL_SIZE = int(os.environ.get("KUBE_POOL_SIZE", 32))
+
+metrics = Metrics("kube")
+_lock = threading.Lock()
+_local = threading.local()
+_configuration = None
+_api = None
+
+
+class InstrumentedApi:
+    """Proxy of CoreV1Api recording every call's latency and errors.
+    """
+
+    def __init__(self, api):
+        self._api = api
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        # keep the docstring, watch.Watch reads the return type from it.
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            start = time.time()
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                metrics.incr("errors")
+                metrics.incr(f"{name}_errors")
+                raise
+            finally:
+                metrics.timing(name, time.time() - start)
+
+        return call
+
+
+def _get_configuration():
+    global _configuration
+    with _lock:
+        if not _configuration:
+            configuration = client.Configuration()
+            config.load_incluster_config(client_configuration=configuration)
+            configuration.connection_pool_maxsize = POOL_SIZE
+            _configuration = configuration
+    return _configuration
+
+
+def preload():
+    """Load the cluster configuration before the worker forks its work horses.
+    """
+    try:
+        _get_configuration()
+    except Exception:
+        # the configuration is loaded again by the work horse, e.g. when the worker isn't in the cluster.
+        pass
+
+
+def core_api():
+    """Get the process-wide CoreV1Api, its connections are pooled and reused by all the deployments and threads.
+
+    rq runs every job in a forked work horse, so the client lives for one run, only the configuration loaded by
+    `preload` in the worker is inherited by all the runs.
+    """
+    global _api
+    configuration = _get_configuration()
+    with _lock:
+        if not _api:
+            _api = InstrumentedApi(client.CoreV1Api(client.ApiClient(configuration)))
+    return _api
+
+
+def exec_api():
+    """Get a CoreV1Api for exec streams of the current thread.
+
+    `stream()` replaces the request function of the api client while opening the websocket, so it can't share the
+    client used by the other calls.
+    """
+    api = getattr(_local, "exec_api", None)
+    if not api:
+        api = client.CoreV1Api(client.ApiClient(_get_configuration()))
+        _local.exec_api = api
+    return api
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from redis import Redis
+
+from deployment import kube
+from deployment.admission import RESOURCES, parse_quantity
+from kubernetes.client.rest import ApiException
+from models.scheduler_run import SchedulerRun
+from models.trigger_run import TriggerRun
+from utils.metrics import Metrics
+
+QUEUE_KEY = "zeroci:reaper:queue"
+OWNER_LABEL = "zeroci/owner"
+RUN_LABEL = "zeroci/run-id"
+WARM_LABEL = "zeroci/warm-pool"
+OWNER = os.environ.get("ZEROCI_OWNER", "zeroci")
+GRACE_PERIOD = 120
+MAX_ATTEMPTS = 5
+PENDING = "pending"
+
+r = Redis()
+metrics = Metrics("reaper")
+
+
+class Reaper:
+    """Delete the pods and services of ZeroCI off the jobs' path.
+
+    Deletions are queued in redis and done by a background thread, what is left in the queue (e.g. the worker
+    crashed) is done by the periodic sweep, which also deletes every resource labelled with this ZeroCI's owner that
+    doesn't belong to a pending run or to the warm pool.
+    """
+
+    def __init__(self):
+        self.namespace = os.environ.get("NAMESPACE", "default")
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def delete(self, name, namespace=None):
+        """Queue the deletion of a pod and its service.
+
+        :param name: pod and service name.
+        :type name: str
+        """
+        item = {"name": name, "namespace": namespace or self.namespace, "attempts": 0}
+        r.rpush(QUEUE_KEY, json.dumps(item))
+        with self._lock:
+            # the thread clears itself under the lock after finding the queue empty, so this item isn't missed.
+            if not self._thread:
+                self._thread = threading.Thread(target=self._drain_thread, daemon=True)
+                self._thread.start()
+
+    def _drain_thread(self):
+        while True:
+            try:
+                self.drain()
+            except Exception:
+                # e.g. the api can't be reached, the queue is left to the sweep.
+                metrics.incr("errors")
+                with self._lock:
+                    self._thread = None
+                return
+            with self._lock:
+                if not r.llen(QUEUE_KEY):
+                    self._thread = None
+                    return
+
+    def wait(self, timeout=30):
+        """Give the drain thread time to finish before the work horse exits, its threads are killed with it.
+
+        The queue is shared by all the runs, what is left in it is deleted by the sweep.
+        """
+        thread = self._thread
+        if thread:
+            thread.join(timeout)
+
+    def drain(self):
+        """Delete the queued resources until the queue is empty.
+        """
+        api = kube.core_api()
+        while True:
+            data = r.lpop(QUEUE_KEY)
+            if not data:
+                return
+            item = json.loads(data)
+            try:
+                self._delete(api, name=item["name"], namespace=item["namespace"])
+                metrics.incr("deleted")
+            except Exception:
+                metrics.incr("errors")
+                item["attempts"] += 1
+                if item["attempts"] < MAX_ATTEMPTS:
+                    r.rpush(QUEUE_KEY, json.dumps(item))
+                    time.sleep(1)
+
+    def _delete(self, api, name, namespace, pod=True, service=True):
+        calls = []
+        if pod:
+            calls.append(lambda: api.delete_namespaced_pod(name=name, namespace=namespace, grace_period_seconds=1))
+        if service:
+            calls.append(lambda: api.delete_namespaced_service(name=name, namespace=namespace))
+        for call in calls:
+            try:
+                call()
+            except ApiException as e:
+                # already deleted.
+                if e.status != 404:
+                    raise
+
+    def _run_pending(self, run_id):
+        for factory in [TriggerRun, SchedulerRun]:
+            run = factory.get(id=run_id)
+            if run and run.status == PENDING:
+                return True
+        return False
+
+    def _is_orphan(self, pod, warm_pods):
+        if pod.status.phase in ["Succeeded", "Failed"]:
+            return True
+        age = datetime.now(timezone.utc) - pod.metadata.creation_timestamp
+        if age.total_seconds() < GRACE_PERIOD:
+            return False
+        labels = pod.metadata.labels or {}
+        run_id = labels.get(RUN_LABEL)
+        if run_id:
+            return not self._run_pending(run_id)
+        if labels.get(WARM_LABEL):
+            return pod.metadata.name not in warm_pods
+        return True
+
+    def _requests(self, pod):
+        total = dict.fromkeys(RESOURCES, 0.0)
+        for container in pod.spec.containers:
+            requests = (container.resources and container.resources.requests) or {}
+            for resource in RESOURCES:
+                total[resource] += parse_quantity(requests.get(resource, 0))
+        return total
+
+    def sweep(self):
+        """Delete the queued resources and the orphaned pods and services.
+        """
+        from deployment.warm_pool import WarmPool
+
+        start = time.time()
+        self.drain()
+        api = kube.core_api()
+        selector = f"{OWNER_LABEL}={OWNER}"
+        warm_pods = WarmPool().names()
+        alive = set()
+        for pod in api.list_namespaced_pod(namespace=self.namespace, label_selector=selector).items:
+            if not self._is_orphan(pod, warm_pods):
+                alive.add(pod.metadata.name)
+                continue
+            try:
+                self._delete(api, name=pod.metadata.name, namespace=self.namespace, service=False)
+            except Exception:
+                metrics.incr("errors")
+                continue
+            metrics.incr("reclaimed_pods")
+            for resource, value in self._requests(pod).items():
+                metrics.incr(f"reclaimed_{resource}", value)
+
+        for service in api.list_namespaced_service(namespace=self.namespace, label_selector=selector).items:
+            if service.metadata.name in alive:
+                continue
+            age = datetime.now(timezone.utc) - service.metadata.creation_timestamp
+            if age.total_seconds() < GRACE_PERIOD:
+                continue
+            try:
+                self._delete(api, name=service.metadata.name, namespace=self.namespace, pod=False)
+            except Exception:
+                metrics.incr("errors")
+                continue
+            metrics.incr("reclaimed_services")
+        metrics.timing("sweep", time.time() - start)
@@ -0,0 +1,103 @@
+import time
+
+import paramiko
+
+from utils.metrics import Metrics
+
+CONNECT_TIMEOUT = 30
+KEEPALIVE = 30
+
+metrics = Metrics("ssh")
+
+
+class SSHSession:
+    """One ssh transport to a pod, commands' channels and the sftp session are multiplexed over it.
+    """
+
+    def __init__(self, host, port=22):
+        self.host = host
+        self.port = port
+        self.client = None
+        self._sftp = None
+
+    def connect(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.MissingHostKeyPolicy())
+        start = time.time()
+        client.connect(hostname=self.host, port=self.port, timeout=CONNECT_TIMEOUT)
+        metrics.timing("handshake", time.time() - start)
+        client.get_transport().set_keepalive(KEEPALIVE)
+        self.client = client
+
+    def is_alive(self):
+        """Check the transport is still usable.
+        """
+        if not self.client:
+            return False
+        transport = self.client.get_transport()
+        if not (transport and transport.is_active()):
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def exec_command(self, cmd, timeout=None, get_pty=False):
+        return self.client.exec_command(cmd, timeout=timeout, get_pty=get_pty)
+
+    def sftp(self):
+        """Return the sftp session of this transport, it is opened on first use.
+        """
+        if not self._sftp or self._sftp.get_channel().closed:
+            self._sftp = self.client.open_sftp()
+        return self._sftp
+
+    def close(self):
+        for conn in (self._sftp, self.client):
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        self._sftp = None
+        self.client = None
+
+
+class SSHPool:
+    """Long-lived ssh sessions of one deployment.
+
+    A session is opened once and reused by every command and file transfer of the deployment.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+
+    def get(self, host, port=22):
+        """Get a healthy session to host, reconnect if the old one is broken.
+
+        :param host: machine's ip or hostname.
+        :type host: str
+        :param port: machine's ssh port.
+        :type port: int
+        :return: SSHSession
+        """
+        key = (host, port)
+        session = self.sessions.get(key)
+        if session:
+            if session.is_alive():
+                metrics.incr("reused")
+                return session
+            session.close()
+            metrics.incr("reconnects")
+
+        session = SSHSession(host=host, port=port)
+        session.connect()
+        metrics.incr("connects")
+        self.sessions[key] = session
+        return session
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions = {}
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import shlex
+import socket
+import tarfile
+import tempfile
+import time
+
+from utils.metrics import Metrics
+
+CHUNK_SIZE = 64 * 1024
+CONTROL_INTERVAL = 1  # seconds
+MAX_SIZE = 500 * 1024 ** 2  # bytes
+SUMS_FILE = ".zeroci.sha256"
+
+metrics = Metrics("transfer")
+
+
+class TransferError(Exception):
+    pass
+
+
+class FileTransfer:
+    """Copy files out of a pod as one compressed tar streamed over a single ssh channel.
+
+    The pod computes the sha256 sum of every file before sending, the sums are sent inside the tar and checked
+    after extraction, so the copied files are byte-exact.
+    """
+
+    def __init__(self, session, max_size=MAX_SIZE, control=None):
+        self.session = session
+        self.max_size = max_size
+        self.control = control
+
+    def _remote_script(self, paths, sums_path):
+        globs = " ".join(self._quote_glob(path.lstrip("/")) for path in paths)
+        return f"""cd /
+set --
+for f in {globs}; do if [ -f "$f" ]; then set -- "$@" "$f"; fi; done
+[ $# -gt 0 ] || exit 3
+sha256sum -- "$@" > {sums_path}
+tar -czf - -C {os.path.dirname(sums_path)} {os.path.basename(sums_path)} -C / "$@"
+rm -f {sums_path}
+"""
+
+    def _quote_glob(self, path):
+        # keep glob characters unquoted so the remote shell expands them.
+        parts = []
+        for part in path.split("/"):
+            if any(char in part for char in "*?["):
+                parts.append(part)
+            else:
+                parts.append(shlex.quote(part))
+        return "/".join(parts)
+
+    def _receive(self, script, archive):
+        channel = self.session.client.get_transport().open_session()
+        try:
+            channel.exec_command(script)
+            if self.control:
+                channel.settimeout(CONTROL_INTERVAL)
+            size = 0
+            while True:
+                try:
+                    data = channel.recv(CHUNK_SIZE)
+                except socket.timeout:
+                    if self.control.check():
+                        raise TransferError(self.control.message)
+                    continue
+                if not data:
+                    break
+                size += len(data)
+                if size > self.max_size:
+                    raise TransferError(f"Archive is bigger than {self.max_size} bytes")
+                archive.write(data)
+            rc = channel.recv_exit_status()
+        finally:
+            channel.close()
+        if rc == 3:
+            return 0
+        if rc:
+            raise TransferError(f"Couldn't archive the files, exit code {rc}")
+        return size
+
+    def _extract(self, archive_path, local_dir):
+        files = {}
+        with tarfile.open(archive_path, "r:gz") as tar:
+            members = tar.getmembers()
+            if sum(member.size for member in members) > self.max_size:
+                raise TransferError(f"Files are bigger than {self.max_size} bytes")
+            sums = {}
+            for member in members:
+                if not member.isfile():
+                    continue
+                name = os.path.normpath(member.name)
+                if name.startswith("..") or os.path.isabs(name):
+                    raise TransferError(f"Unsafe path in archive {member.name}")
+                source = tar.extractfile(member)
+                if name == SUMS_FILE:
+                    for line in source.read().decode().splitlines():
+                        checksum, path = line.split(maxsplit=1)
+                        sums[os.path.normpath(path.lstrip("*"))] = checksum
+                    continue
+                local_path = os.path.join(local_dir, name)
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                digest = hashlib.sha256()
+                with open(local_path, "wb") as f:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                        f.write(chunk)
+                files[name] = (local_path, digest.hexdigest())
+
+        result = {}
+        for name, (local_path, checksum) in files.items():
+            if sums.get(name) != checksum:
+                for path, _ in files.values():
+                    os.remove(path)
+                raise TransferError(f"Checksum mismatch for /{name}")
+            result[f"/{name}"] = local_path
+        return result
+
+    def fetch(self, paths, local_dir, remove=False):
+        """Fetch files matching paths or globs, they should be on a volume shared with the helper container.
+
+        :param paths: absolute paths or globs on the pod.
+        :type paths: list
+        :param local_dir: directory to extract the files in, pod paths are kept under it.
+        :type local_dir: str
+        :param remove: remove the files from the pod after being fetched.
+        :type remove: bool
+        :return: {remote path: local path} of fetched files.
+        :return type: dict
+        """
+        start = time.time()
+        sums_path = f"/tmp/{SUMS_FILE}"
+        os.makedirs(local_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(suffix=".tar.gz", dir=local_dir) as archive:
+            size = self._receive(self._remote_script(paths, sums_path), archive)
+            if not size:
+                return {}
+            archive.flush()
+            files = self._extract(archive.name, local_dir)
+
+        if remove and files:
+            remote_paths = " ".join(shlex.quote(path) for path in files)
+            _, stdout, _ = self.session.exec_command(f"rm -f {remote_paths}")
+            stdout.channel.recv_exit_status()
+        metrics.incr("bytes", size)
+        metrics.incr("files", len(files))
+        metrics.timing("fetch", time.time() - start)
+        return files
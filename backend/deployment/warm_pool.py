@@ -0,0 +1,149 @@
+import json
+import os
+import time
+
+from redis import Redis
+
+from utils.maintenance import maintenance_queue
+from utils.metrics import Metrics
+
+POOL_KEY = "zeroci:warm_pool:{image}"
+LOCK_KEY = "zeroci:warm_pool:lock"
+WARM_REPO_PATH = "/zeroci/code"
+# warm pods are created before knowing the job, so they run the default shell.
+WARM_SHELL = "/bin/sh"
+IDLE_EXPIRY = 1200
+MAX_SIZE = 10
+
+r = Redis()
+metrics = Metrics("warm_pool")
+
+
+class WarmPool:
+    """Pool of pre-created pods per image, shared by all the workers through redis.
+
+    It is disabled unless `WARM_POOL_IMAGES` is set, the pool is configured with environment variables:
+    - `WARM_POOL_IMAGES`: comma separated targets of `image=count`, e.g. `python:3.8=2,ubuntu:20.04=1`.
+    - `WARM_POOL_IDLE`: seconds after which an unclaimed pod is deleted.
+    - `WARM_POOL_MAX`: maximum number of warm pods for all images.
+    """
+
+    def __init__(self):
+        self.targets = self._parse_targets(os.environ.get("WARM_POOL_IMAGES", ""))
+        self.idle_expiry = int(os.environ.get("WARM_POOL_IDLE", IDLE_EXPIRY))
+        self.max_size = int(os.environ.get("WARM_POOL_MAX", MAX_SIZE))
+
+    @property
+    def enabled(self):
+        return bool(self.targets)
+
+    def _parse_targets(self, value):
+        targets = {}
+        for item in value.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            image, _, count = item.rpartition("=")
+            if not image:
+                image, count = count, 1
+            targets[image] = int(count)
+        return targets
+
+    def _key(self, image):
+        return POOL_KEY.format(image=image)
+
+    def size(self):
+        return sum(r.llen(self._key(image)) for image in self.targets)
+
+    def names(self):
+        """Get the names of all the pods waiting in the pool.
+        """
+        names = set()
+        for key in r.scan_iter(POOL_KEY.format(image="*")):
+            for data in r.lrange(key, 0, -1):
+                names.add(json.loads(data)["name"])
+        return names
+
+    def claim(self, image, shell_bin=WARM_SHELL):
+        """Take a warm pod of this image out of the pool.
+
+        :param image: docker image name.
+        :type image: str
+        :param shell_bin: job's shell, only jobs using the warm pods' shell can take one.
+        :type shell_bin: str
+        :return: pod name or None if there is no warm pod.
+        """
+        if not self.enabled or shell_bin != WARM_SHELL:
+            return None
+        start = time.time()
+        while True:
+            data = r.lpop(self._key(image))
+            if not data:
+                metrics.incr("misses")
+                return None
+            pod = json.loads(data)
+            if time.time() - pod["created"] > self.idle_expiry:
+                self._delete(pod["name"])
+                metrics.incr("expired")
+                continue
+            metrics.incr("hits")
+            metrics.timing("claim", time.time() - start)
+            return pod["name"]
+
+    def _delete(self, name):
+        from deployment.container import Container
+
+        container = Container()
+        container.attach(name)
+        container.delete()
+
+    def _expire(self):
+        for image in self.targets:
+            key = self._key(image)
+            for data in r.lrange(key, 0, -1):
+                pod = json.loads(data)
+                if time.time() - pod["created"] > self.idle_expiry:
+                    if r.lrem(key, 1, data):
+                        self._delete(pod["name"])
+                        metrics.incr("expired")
+
+    def refill(self):
+        """Delete expired pods and create the missing ones to reach every image's target within the size cap.
+        """
+        if not self.enabled:
+            return
+        from deployment.container import Container
+
+        lock = r.lock(LOCK_KEY, timeout=300, blocking_timeout=0)
+        if not lock.acquire():
+            # another worker is already refilling the pool.
+            return
+        try:
+            self._expire()
+            available = self.max_size - self.size()
+            for image, target in self.targets.items():
+                missing = min(target - r.llen(self._key(image)), available)
+                for _ in range(missing):
+                    container = Container()
+                    try:
+                        name = container.create_warm(image=image, lifetime=3600 + self.idle_expiry)
+                    except Exception:
+                        container.delete()
+                        metrics.incr("create_errors")
+                        continue
+                    r.rpush(self._key(image), json.dumps({"name": name, "created": time.time()}))
+                    metrics.incr("created")
+                    available -= 1
+            metrics.set("size", self.size())
+        finally:
+            lock.release()
+
+    def refill_async(self):
+        """Refill the pool on the maintenance worker, a thread would be killed with the run's work horse.
+        """
+        if self.enabled:
+            maintenance_queue.enqueue_call(func=refill, result_ttl=0, timeout=600)
+
+
+def refill():
+    WarmPool().refill()
@@ -2,54 +2,125 @@ import sys
 
 sys.path.append("/sandbox/code/github/threefoldtech/zeroCI/backend")
 
-from datetime import datetime
-from pathlib import Path
+import os
+from datetime import datetime, timedelta
 
 from redis import Redis
 
-from models.base import StoredFactory
+from models.run_result import RunResult
 from models.scheduler_run import SchedulerRun
 from models.trigger_run import TriggerRun
-
-
-REDIS_PATH = "/var/lib/redis"
-WHOOSH_PATH = "/root/.config/jumpscale/whoosh_indexes/"
-
-
-def remove(factory, days=30):
-    r = Redis()
-    names = factory.list_all()
-    for name in names:
-        obj = factory.get(name)
-        run_time = datetime.fromtimestamp(obj.timestamp)
-        now_time = datetime.now()
-        time_diff = now_time - run_time
-        if time_diff.days > days:
-            factory.delete(name)
-            r.delete(obj.id)
-
-
-def get_size_in_giga_bytes(path):
-    root = Path(path)
-    size_in_bytes = sum(f.stat().st_size for f in root.rglob("*") if f.is_file())
-    size_in_giga_bytes = size_in_bytes / (1024 ** 3)
-    return size_in_giga_bytes
-
-
-def get_total_size():
-    whoosh_data_size = get_size_in_giga_bytes(WHOOSH_PATH)
-    redis_data_size = get_size_in_giga_bytes(REDIS_PATH)
-    return whoosh_data_size + redis_data_size
+from utils.branch_index import BranchIndex
+from utils.latest_status import LatestStatus
+from utils.live_logs import STREAM_KEY
+from utils.log_archive import LogArchive
+from utils.metrics import Metrics
+from utils.storage import Storage, bin_path, run_keys
+
+# maximum space used by the runs in GiB, the oldest runs are deleted when it is exceeded.
+STORAGE_BUDGET = float(os.environ.get("STORAGE_BUDGET", 10))
+# runs newer than this are never deleted.
+MIN_AGE = timedelta(days=2)
+BATCH_SIZE = 100
+PENDING = "pending"
+STREAM_PREFIX = STREAM_KEY.format(run_id="")
+
+r = Redis()
+metrics = Metrics("cleanup")
+
+
+def purge(factory, name, summary):
+    """Delete a run with its results, logs and bin release.
+    """
+    run_id = name.strip("model")
+    RunResult(run_id).clear()
+    LogArchive(run_id).clear()
+    keys = run_keys(run_id)
+    if keys:
+        r.delete(*keys)
+    path = bin_path(summary)
+    if path and os.path.isfile(path):
+        os.remove(path)
+    factory.delete(name)
+    Storage().release(run_id)
+    if summary.get("schedule_name"):
+        LatestStatus().forget(run_id, schedule_name=summary["schedule_name"])
+    else:
+        LatestStatus().forget(run_id, repo=summary.get("repo"), branch=summary.get("branch"))
+        BranchIndex().forget(repo=summary.get("repo"), branch=summary.get("branch"), run_id=run_id)
+
+
+def oldest_batch(before):
+    """Get the oldest runs of all factories.
+
+    :return: list of (factory, name, summary) ordered by timestamp.
+    """
+    runs = []
+    for factory in [TriggerRun, SchedulerRun]:
+        runs.extend((factory, name, summary) for name, summary in factory.oldest(BATCH_SIZE, before=before))
+    runs.sort(key=lambda run: run[2].get("timestamp") or 0)
+    return runs[:BATCH_SIZE]
+
+
+def archive_logs():
+    """Archive the logs left in redis by finished runs, e.g. the runs finished before archiving the logs.
+
+    The streams left by parallel jobs and shards of finished or deleted runs are deleted.
+    """
+    for key in r.scan_iter(count=1000):
+        key = key.decode()
+        log_id = key[len(STREAM_PREFIX) :] if key.startswith(STREAM_PREFIX) else key
+        # streams of parallel jobs and shards are `<run_id>:<tag>`.
+        run_id, _, tag = log_id.partition(":")
+        if tag and not key.startswith(STREAM_PREFIX):
+            continue
+        if not run_id.isdigit() or r.type(key) not in [b"stream", b"list"] or r.ttl(key) != -1:
+            continue
+        for factory in [TriggerRun, SchedulerRun]:
+            summary = factory._model.get_summary(f"model{run_id}")
+            if summary:
+                if summary["status"] != PENDING and not LogArchive(run_id).exists():
+                    LogArchive(run_id).archive()
+                    Storage().account(run_id, summary)
+                    metrics.incr("archived_logs")
+                if summary["status"] != PENDING and tag:
+                    # left by a job that crashed before its logs were merged in the run's stream.
+                    r.delete(key)
+                    metrics.incr("deleted_streams")
+                break
+        else:
+            if tag:
+                # the run is deleted.
+                r.delete(key)
+                metrics.incr("deleted_streams")
 
 
 def check():
-    # Remove data if it is more than 10 GB
-    for day in range(60, 1, -1):
-        if get_total_size() > 10:
-            remove(TriggerRun, days=day)
-            remove(SchedulerRun, days=day)
-        else:
+    """Delete the oldest runs in batches until the used space is under the budget.
+    """
+    archive_logs()
+    storage = Storage()
+    total = storage.total()
+    if total is None:
+        total = storage.recount([TriggerRun, SchedulerRun])
+    store_size = storage.store_size()
+    total += store_size
+    budget = STORAGE_BUDGET * 1024 ** 3
+    before = int((datetime.now() - MIN_AGE).timestamp())
+    while total > budget:
+        runs = oldest_batch(before)
+        if not runs:
             break
+        for factory, name, summary in runs:
+            purge(factory, name, summary)
+            metrics.incr("deleted_runs")
+            total = storage.total() + store_size
+            if total <= budget:
+                break
+        # the deleted documents are measured again once per batch.
+        store_size = storage.store_size()
+        total = storage.total() + store_size
+    metrics.set("used_bytes", total)
 
 
 if __name__ == "__main__":
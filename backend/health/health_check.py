@@ -4,6 +4,7 @@ sys.path.append("/sandbox/code/github/threefoldtech/zeroCI/backend")
 
 from redis import Redis
 
+from deployment.warm_pool import WarmPool
 from health_recover import Recover
 from utils.utils import Utils
 
@@ -49,6 +50,13 @@ class Health(Utils):
                 if not pid:
                     recover.worker(i)
 
+    def test_maintenance_worker(self):
+        """Check the maintenance worker is up.
+        """
+        pid = self.get_process_pid("python3 maintenance_worker")
+        if not pid:
+            recover.maintenance_worker()
+
     def test_schedule(self):
         """Check rq schedule is up.
         """
@@ -56,10 +64,17 @@ class Health(Utils):
         if not pid:
             recover.scheduler()
 
+    def test_warm_pool(self):
+        """Delete expired warm pods and refill the pool if it is enabled.
+        """
+        WarmPool().refill()
+
 
 if __name__ == "__main__":
     health = Health()
     health.test_zeroci_server()
     health.test_redis()
     health.test_workers()
+    health.test_maintenance_worker()
     health.test_schedule()
+    health.test_warm_pool()
@@ -17,6 +17,10 @@ class Recover(Utils):
         cmd = f"/bin/bash -c 'cd {PATH}; python3 worker{id}.py &>> worker_{id}.log &'"
         self.execute_cmd(cmd=cmd, timeout=TIMEOUT)
 
+    def maintenance_worker(self):
+        cmd = f"/bin/bash -c 'cd {PATH}; python3 maintenance_worker.py maintenance &>> maintenance_worker.log &'"
+        self.execute_cmd(cmd=cmd, timeout=TIMEOUT)
+
     def scheduler(self):
         cmd = f"/bin/bash -c 'cd {PATH}; rqscheduler &>> schedule.log &'"
         self.execute_cmd(cmd=cmd, timeout=TIMEOUT)
@@ -0,0 +1,9 @@
+import sys
+
+sys.path.append("/sandbox/code/github/threefoldtech/zeroCI/backend")
+
+from deployment.reaper import Reaper
+
+if __name__ == "__main__":
+    reaper = Reaper()
+    reaper.sweep()
@@ -1,5 +1,16 @@
+import json
+
+from redis import Redis
+
 from jumpscale.core.base import Base, fields, StoredFactory
 
+from .run_result import RunResult
+
+INDEX_KEY = "zeroci:index:{model}"
+SCAN_BATCH = 100
+
+r = Redis()
+
 
 class Document(Base):
     @property
@@ -11,6 +22,208 @@ class Document(Base):
         return self.instance_name
 
 
+class RunDocument(Document):
+    @property
+    def results(self):
+        """Steps' results of the run, they are loaded when they are iterated.
+        """
+        return RunResult(self.id, legacy=self.result)
+
+
+class IndexedFactory(StoredFactory):
+    """Stored factory that keeps redis indexes of its instances ordered by `timestamp`.
+
+    Every index is a sorted set per value of its fields, e.g. `(repo, branch)` has a sorted set for every branch,
+    and there is a sorted set of all instances. The `summary` fields of every instance are kept in a redis hash,
+    so the newest instances matching some of these fields can be listed without loading them from the store.
+    """
+
+    def __init__(self, type_, indexes=None, summary=None, *args, **kwargs):
+        super().__init__(type_, *args, **kwargs)
+        self.indexes = [tuple(index) for index in indexes or []]
+        self.summary = list(summary or [])
+        for index in self.indexes:
+            for field in index:
+                if field not in self.summary:
+                    self.summary.append(field)
+        if "timestamp" not in self.summary:
+            self.summary.append("timestamp")
+        self.prefix = INDEX_KEY.format(model=type_.__name__)
+
+    @property
+    def summary_key(self):
+        return f"{self.prefix}:summary"
+
+    @property
+    def all_key(self):
+        return f"{self.prefix}:all"
+
+    @property
+    def built_key(self):
+        return f"{self.prefix}:built"
+
+    @property
+    def layout(self):
+        """Indexes and summary fields the indexes were built with, they are rebuilt when it changes.
+        """
+        return json.dumps([self.indexes, self.summary])
+
+    def index_key(self, index, values):
+        """Get the sorted set key of an index for some values.
+
+        :param index: index fields.
+        :type index: tuple
+        :param values: {field: value} of the index fields.
+        :type values: dict
+        """
+        return f"{self.prefix}:{','.join(index)}:{json.dumps([values[field] for field in index])}"
+
+    def _keys(self, summary):
+        keys = [self.all_key]
+        for index in self.indexes:
+            keys.append(self.index_key(index, summary))
+        return keys
+
+    def _summary(self, instance):
+        return {field: getattr(instance, field) for field in self.summary}
+
+    def get_summary(self, name):
+        data = r.hget(self.summary_key, name)
+        return json.loads(data) if data else None
+
+    def _index(self, pipeline, name, summary, old=None):
+        if old:
+            for key in set(self._keys(old)) - set(self._keys(summary)):
+                pipeline.zrem(key, name)
+        for key in self._keys(summary):
+            pipeline.zadd(key, {name: summary["timestamp"] or 0})
+        pipeline.hset(self.summary_key, name, json.dumps(summary))
+
+    def _validate_and_save_instance(self, instance):
+        super()._validate_and_save_instance(instance)
+        name = instance.instance_name
+        pipeline = r.pipeline()
+        self._index(pipeline, name, self._summary(instance), old=self.get_summary(name))
+        pipeline.execute()
+
+    def _delete_instance(self, name):
+        old = self.get_summary(name)
+        super()._delete_instance(name)
+        if old:
+            pipeline = r.pipeline()
+            for key in self._keys(old):
+                pipeline.zrem(key, name)
+            pipeline.hdel(self.summary_key, name)
+            pipeline.execute()
+
+    def rebuild(self):
+        """Rebuild the indexes from the store.
+        """
+        keys = list(r.scan_iter(match=f"{self.prefix}:*", count=1000))
+        if keys:
+            r.delete(*keys)
+        pipeline = r.pipeline()
+        for count, name in enumerate(self.store.list_all(), start=1):
+            instance = self.find(name)
+            if not instance:
+                continue
+            self._index(pipeline, name, self._summary(instance))
+            if count % SCAN_BATCH == 0:
+                pipeline.execute()
+        pipeline.execute()
+        r.set(self.built_key, self.layout)
+
+    def ensure_index(self):
+        """Build the indexes if they were never built or were built with other fields, e.g. after upgrading or losing
+        redis data.
+        """
+        built = r.get(self.built_key)
+        if not built or built.decode() != self.layout:
+            self.rebuild()
+
+    def oldest(self, count, before=None):
+        """Get the oldest instances.
+
+        :param count: maximum number of instances.
+        :type count: int
+        :param before: only instances older than this timestamp.
+        :return: list of (name, summary)
+        """
+        max_score = f"({before}" if before is not None else "+inf"
+        names = [name.decode() for name in r.zrangebyscore(self.all_key, "-inf", max_score, start=0, num=count)]
+        if not names:
+            return []
+        summaries = r.hmget(self.summary_key, names)
+        return [(name, json.loads(data) if data else {}) for name, data in zip(names, summaries)]
+
+    def count(self, **filters):
+        """Count the instances matching the filters if they are the fields of an index.
+
+        :return: count or None if it can't be known without scanning.
+        """
+        if not filters:
+            return r.zcard(self.all_key)
+        for index in self.indexes:
+            if set(index) == set(filters) and not any(isinstance(v, (list, tuple, set)) for v in filters.values()):
+                return r.zcard(self.index_key(index, filters))
+        return None
+
+    def _driver(self, filters):
+        """Choose the smallest sorted set that all the matching instances are in.
+        """
+        best, best_size = self.all_key, None
+        for index in self.indexes:
+            if all(field in filters and not isinstance(filters[field], (list, tuple, set)) for field in index):
+                key = self.index_key(index, filters)
+                size = r.zcard(key)
+                if best_size is None or size < best_size:
+                    best, best_size = key, size
+        return best
+
+    @staticmethod
+    def _match(summary, filters):
+        for field, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                if summary.get(field) not in value:
+                    return False
+            elif summary.get(field) != value:
+                return False
+        return True
+
+    def scan(self, cursor=None, **filters):
+        """Iterate over the instances matching the filters from the newest to the oldest.
+
+        :param cursor: cursor returned by a previous scan to continue after it.
+        :type cursor: str
+        :param filters: {field: value or list of values} of summary fields.
+        :return: generator of (cursor, name, summary)
+        """
+        for field in filters:
+            if field not in self.summary:
+                raise ValueError(f"{field} is not indexed")
+        key = self._driver(filters)
+        max_score, after = "+inf", None
+        if cursor:
+            max_score, after = cursor.split(":", 1)
+        offset = 0
+        while True:
+            batch = r.zrevrangebyscore(key, max_score, "-inf", start=offset, num=SCAN_BATCH, withscores=True)
+            if not batch:
+                return
+            offset += len(batch)
+            names = [name.decode() for name, _ in batch]
+            summaries = r.hmget(self.summary_key, names)
+            for name, (_, score), data in zip(names, batch, summaries):
+                # members with the same score are ordered by name descending.
+                if after and score == float(max_score) and name >= after:
+                    continue
+                if not data:
+                    continue
+                summary = json.loads(data)
+                if self._match(summary, filters):
+                    yield f"{score}:{name}", name, summary
+
+
 class ModelFactory:
     _model = None
 
@@ -33,6 +246,14 @@ class ModelFactory:
 
     @classmethod
     def distinct(cls, field, **kwargs):
+        """Get the distinct values of a field of the objects matching the filters.
+
+        On an indexed model it reads the summaries of the smallest index matching the filters, so the filters should
+        be the fields of an index, otherwise all the instances are scanned.
+        """
+        if isinstance(cls._model, IndexedFactory) and field in cls._model.summary:
+            return list({summary[field] for _, _, summary in cls._model.scan(**kwargs)})
+
         if kwargs:
             _, _, objects = cls._model.find_many(**kwargs)
         else:
@@ -73,3 +294,53 @@ class ModelFactory:
         if order_by:
             results.sort(key=lambda x: x[order_by], reverse=not asc)
         return results
+
+    @classmethod
+    def latest(cls, fields, limit=None, cursor=None, **filters):
+        """Get the newest objects matching the filters using the model's indexes.
+
+        Only the returned objects are loaded from the store and only if some of the fields aren't in the index summary.
+
+        :param fields: fields to be returned of every object.
+        :type fields: list
+        :param limit: maximum number of objects.
+        :type limit: int
+        :param cursor: cursor returned by a previous call to get the next objects.
+        :type cursor: str
+        :param filters: {field: value or list of values} of indexed fields.
+        :return: (next cursor or None if there are no more objects, list of objects)
+        """
+        results = []
+        next_cursor = last = None
+        for position, name, summary in cls._model.scan(cursor=cursor, **filters):
+            if limit is not None and len(results) == limit:
+                next_cursor = last
+                break
+            obj_dict = {}
+            obj = None
+            for field in fields:
+                if field in summary:
+                    obj_dict[field] = summary[field]
+                else:
+                    obj = obj or cls._model.find(name)
+                    obj_dict[field] = getattr(obj, field) if obj else None
+            obj_dict["id"] = name.strip("model")
+            results.append(obj_dict)
+            last = position
+        return next_cursor, results
+
+    @classmethod
+    def oldest(cls, count, before=None):
+        return cls._model.oldest(count, before=before)
+
+    @classmethod
+    def count(cls, **filters):
+        return cls._model.count(**filters)
+
+    @classmethod
+    def rebuild_index(cls):
+        cls._model.rebuild()
+
+    @classmethod
+    def ensure_index(cls):
+        cls._model.ensure_index()
@@ -0,0 +1,155 @@
+import gzip
+import json
+import os
+import shutil
+import threading
+
+RESULTS_DIR = "/zeroci/results"
+LOG_FILE = "steps.jsonl"
+
+
+class RunResult:
+    """Results of a run's steps, they are stored out of the run document in `/zeroci/results/<run_id>/<index>.json.gz`.
+
+    While the run is going, results are appended to `steps.jsonl` in the same directory, so storing a step writes
+    only this step whatever the number of steps before it. The log starts with the number of step files it follows
+    and it is moved to step files by `compact` when the run finishes.
+
+    Results are read from the files when they are iterated, runs saved before keep their results in the document
+    and they are read from there.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, run_id, legacy=None):
+        self.run_id = str(run_id)
+        self.path = os.path.join(RESULTS_DIR, self.run_id)
+        self.log_path = os.path.join(self.path, LOG_FILE)
+        self.legacy = legacy
+
+    def _step_path(self, index):
+        return os.path.join(self.path, f"{index}.json.gz")
+
+    def _indexes(self):
+        if not os.path.isdir(self.path):
+            return []
+        indexes = []
+        for file_name in os.listdir(self.path):
+            # step files of the runs finished before compressing them end with `.json`.
+            name = file_name.split(".", 1)[0]
+            if file_name.endswith((".json", ".json.gz")) and name.isdigit():
+                indexes.append(int(name))
+        return sorted(set(indexes))
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _load(self, index):
+        path = self._step_path(index)
+        try:
+            if os.path.exists(path):
+                with gzip.open(path, "rt") as f:
+                    return json.load(f)
+            with open(path[: -len(".gz")]) as f:
+                return json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+    def _read_log(self):
+        """Read the appended results.
+
+        :return: (index of the first appended result, results) or (None, []) if there is no log.
+        """
+        try:
+            with open(self.log_path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None, []
+        if not lines:
+            return None, []
+        try:
+            base = json.loads(lines[0])["base"]
+        except (ValueError, KeyError):
+            return None, []
+        results = []
+        for line in lines[1:]:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                # the last line wasn't completely written.
+                break
+        return base, results
+
+    def _steps(self):
+        """Get the indexes of the step files and the appended results that follow them.
+        """
+        indexes = self._indexes()
+        base, logged = self._read_log()
+        if base is not None:
+            # step files after the base are from an unfinished compaction of the same log.
+            indexes = [index for index in indexes if index < base]
+        return indexes, logged
+
+    def append(self, result):
+        """Store a step's result after the previous ones, only this result is written.
+
+        :param result: {"type", "status", "name", "content"} of the step.
+        :type result: dict
+        """
+        line = json.dumps(result) + "\n"
+        with self._lock:
+            if not os.path.exists(self.log_path):
+                os.makedirs(self.path, exist_ok=True)
+                indexes = self._indexes()
+                line = json.dumps({"base": indexes[-1] + 1 if indexes else 0}) + "\n" + line
+            with open(self.log_path, "a") as f:
+                f.write(line)
+
+    def compact(self):
+        """Move the appended results to step files, it is done once the run finishes.
+        """
+        with self._lock:
+            base, logged = self._read_log()
+            if base is None:
+                return
+            for offset, result in enumerate(logged):
+                self._write(self._step_path(base + offset), result)
+            os.remove(self.log_path)
+
+    def get(self, index):
+        """Get a step's result.
+
+        :return: result or None if it is not found.
+        """
+        if not os.path.isdir(self.path) and self.legacy:
+            return self.legacy[index] if 0 <= index < len(self.legacy) else None
+        indexes, logged = self._steps()
+        if index >= len(indexes):
+            offset = index - len(indexes)
+            return logged[offset] if offset < len(logged) else None
+        return self._load(indexes[index])
+
+    def __iter__(self):
+        if not os.path.isdir(self.path):
+            yield from self.legacy or []
+            return
+        indexes, logged = self._steps()
+        for index in indexes:
+            result = self._load(index)
+            if result is not None:
+                yield result
+        yield from logged
+
+    def __len__(self):
+        if not os.path.isdir(self.path):
+            return len(self.legacy or [])
+        indexes, logged = self._steps()
+        return len(indexes) + len(logged)
+
+    def clear(self):
+        """Delete the results of the run, e.g. before running it again.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -1,17 +1,20 @@
-from .base import Document, ModelFactory, fields, StoredFactory
+from .base import IndexedFactory, ModelFactory, RunDocument, fields
 
 
-class ScheduleModel(Document):
+class ScheduleModel(RunDocument):
     timestamp = fields.Integer(required=True, indexed=True)
     schedule_name = fields.String(required=True)
     status = fields.String(required=True)
     bin_release = fields.String()
     triggered_by = fields.String(default="ZeroCI Scheduler")
+    # results of the runs saved before storing them out of the document, see `RunDocument.results`.
     result = fields.List(field=fields.Typed(dict))
 
 
 class SchedulerRun(ModelFactory):
-    _model = StoredFactory(ScheduleModel)
+    _model = IndexedFactory(
+        ScheduleModel, indexes=[("schedule_name",), ("status",)], summary=["bin_release", "triggered_by"]
+    )
 
     def __new__(self, **kwargs):
         name = "model" + str(int(kwargs["timestamp"] * 10 ** 6))
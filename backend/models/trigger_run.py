@@ -1,7 +1,7 @@
-from .base import Document, ModelFactory, fields, StoredFactory
+from .base import IndexedFactory, ModelFactory, RunDocument, fields
 
 
-class TriggerModel(Document):
+class TriggerModel(RunDocument):
     timestamp = fields.Integer(required=True, indexed=True)
     repo = fields.String(required=True)
     branch = fields.String(required=True)
@@ -10,11 +10,16 @@ class TriggerModel(Document):
     status = fields.String(required=True)
     bin_release = fields.String()
     triggered_by = fields.String(default="VCS Hook")
+    # results of the runs saved before storing them out of the document, see `RunDocument.results`.
     result = fields.List(field=fields.Typed(dict))
 
 
 class TriggerRun(ModelFactory):
-    _model = StoredFactory(TriggerModel)
+    _model = IndexedFactory(
+        TriggerModel,
+        indexes=[("repo",), ("repo", "branch"), ("status",)],
+        summary=["commit", "committer", "bin_release", "triggered_by"],
+    )
 
     def __new__(self, **kwargs):
         name = "model" + str(int(kwargs["timestamp"] * 10 ** 6))
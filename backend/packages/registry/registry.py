@@ -0,0 +1,144 @@
+import os
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from redis import Redis
+
+from utils.metrics import Metrics
+
+CACHE_KEY = "zeroci:image:{image}"
+POSITIVE_TTL = int(os.environ.get("IMAGE_CACHE_TTL", 24 * 3600))
+NEGATIVE_TTL = int(os.environ.get("IMAGE_CACHE_NEGATIVE_TTL", 300))
+REQUEST_TIMEOUT = 10
+MAX_LOOKUPS = 5
+
+r = Redis()
+metrics = Metrics("images")
+
+
+def parse_image(image_name):
+    """Split image name into repository and tag, the registry's port isn't taken as a tag.
+
+    :return: (repository, tag)
+    """
+    repository, _, tag = image_name.rpartition(":")
+    if not repository or "/" in tag:
+        return image_name, "latest"
+    return repository, tag
+
+
+class RegistryInterface(metaclass=ABCMeta):
+    """The Docker Registry Interface"""
+
+    @abstractmethod
+    def image_exists(self, repository, tag):
+        """Check if the image exists on the registry.
+
+        :return: bool, it raises if the registry couldn't answer.
+        """
+
+
+class DockerHub(RegistryInterface):
+    """Docker Hub registry using its v1 tags api"""
+
+    def image_exists(self, repository, tag):
+        response = requests.get(
+            f"https://index.docker.io/v1/repositories/{repository}/tags/{tag}", timeout=REQUEST_TIMEOUT
+        )
+        if response.status_code == requests.codes.ok:
+            return True
+        if response.status_code == requests.codes.not_found:
+            return False
+        response.raise_for_status()
+        return False
+
+
+class RegistryV2(RegistryInterface):
+    """Registry implementing the docker registry http api v2, e.g. a local registry or a mirror"""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def image_exists(self, repository, tag):
+        headers = {
+            "Accept": "application/vnd.docker.distribution.manifest.v2+json,"
+            "application/vnd.docker.distribution.manifest.list.v2+json,"
+            "application/vnd.oci.image.index.v1+json"
+        }
+        response = requests.head(
+            f"{self.url}/v2/{repository}/manifests/{tag}", headers=headers, timeout=REQUEST_TIMEOUT
+        )
+        if response.status_code == requests.codes.ok:
+            return True
+        if response.status_code == requests.codes.not_found:
+            return False
+        response.raise_for_status()
+        return False
+
+
+class RegistryFactory:
+    """The Docker Registry Factory Class"""
+
+    @staticmethod
+    def get_registry():
+        url = os.environ.get("IMAGE_REGISTRY")
+        if url:
+            return RegistryV2(url)
+        return DockerHub()
+
+
+class ImageChecker:
+    """Check docker images existence with a cache shared by all the workers.
+
+    Found images are cached for `IMAGE_CACHE_TTL` seconds and missing ones for `IMAGE_CACHE_NEGATIVE_TTL`.
+    If `IMAGE_VALIDATION_OFFLINE` is set, the registry isn't asked and images not in the cache are accepted.
+    Images are accepted too if the registry can't be reached, the deployment will report it if it can't be pulled.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or RegistryFactory.get_registry()
+        self.offline = bool(os.environ.get("IMAGE_VALIDATION_OFFLINE"))
+
+    def exists(self, image_name):
+        """Check if the image exists.
+
+        :param image_name: docker image name with optional tag.
+        :type image_name: str
+        :return: bool
+        """
+        key = CACHE_KEY.format(image=image_name)
+        cached = r.get(key)
+        if cached is not None:
+            metrics.incr("cache_hits")
+            return cached == b"1"
+        if self.offline:
+            metrics.incr("offline")
+            return True
+
+        metrics.incr("cache_misses")
+        repository, tag = parse_image(image_name)
+        try:
+            exists = self.registry.image_exists(repository, tag)
+        except Exception:
+            metrics.incr("registry_errors")
+            return True
+        if exists:
+            r.set(key, "1", ex=POSITIVE_TTL)
+        else:
+            r.set(key, "0", ex=NEGATIVE_TTL)
+        return exists
+
+    def exists_many(self, images):
+        """Check several images concurrently.
+
+        :param images: docker images names.
+        :type images: list
+        :return: {image name: bool}
+        :return type: dict
+        """
+        images = list(set(images))
+        if not images:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(images), MAX_LOOKUPS)) as executor:
+            return dict(zip(images, executor.map(self.exists, images)))
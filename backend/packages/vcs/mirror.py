@@ -0,0 +1,156 @@
+import os
+import time
+from contextlib import contextmanager
+from urllib.parse import urljoin
+
+from redis import Redis
+from redis.exceptions import LockError
+
+from models.initial_config import InitialConfig
+from utils.metrics import Metrics
+from utils.utils import Utils
+
+MIRRORS_DIR = "/zeroci/mirrors"
+BUNDLES_DIR = "/zeroci/mirrors/bundles"
+LOCK_KEY = "zeroci:mirror:{repo}"
+BUNDLES_LOCK_KEY = "zeroci:mirror:bundles"
+BUNDLE_EXPIRY = 24 * 3600
+
+r = Redis()
+metrics = Metrics("mirror")
+
+
+class RepoMirror(Utils):
+    """Local bare mirror of a repository, refreshed incrementally and shared by all the runs of this repo.
+
+    Pods get the exact commit they need as a git bundle created from the mirror, so the vcs host is only
+    asked for the new objects once per push.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.path = os.path.join(MIRRORS_DIR, f"{repo}.git")
+
+    @property
+    def clone_url(self):
+        configs = InitialConfig()
+        return urljoin(configs.vcs_host, f"{self.repo}.git")
+
+    @contextmanager
+    def _lock(self, control=None):
+        """Hold the mirror's lock, the wait for it stops with the run.
+
+        :param control: run control of the run waiting for the mirror.
+        :type control: RunControl
+        :raises LockError: if the lock isn't taken in time.
+        """
+        lock = r.lock(LOCK_KEY.format(repo=self.repo), timeout=600)
+        start = time.time()
+        while not lock.acquire(blocking_timeout=1):
+            if (control and control.check()) or time.time() - start > 600:
+                raise LockError("Couldn't take the mirror's lock")
+        try:
+            yield
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                pass
+
+    def _has_commit(self, commit):
+        response = self.execute_cmd(f"git -C {self.path} cat-file -e {commit}^{{commit}}")
+        return not response.returncode
+
+    def update(self, commit=None, control=None):
+        """Create the mirror or fetch the new objects from the vcs host.
+
+        :param commit: if given, the fetch is skipped when the mirror already has this commit.
+        :type commit: str
+        :param control: run control of the run waiting for the mirror, the fetch is stopped with the run.
+        :type control: RunControl
+        :return: True if the mirror is up to date (and has the commit).
+        """
+        with self._lock(control=control):
+            if os.path.exists(self.path):
+                if commit and self._has_commit(commit):
+                    metrics.incr("hits")
+                    return True
+                cmd = f"git -C {self.path} remote update --prune"
+            else:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                cmd = f"git clone --mirror {self.clone_url} {self.path}"
+            start = time.time()
+            response = self.execute_cmd(cmd, timeout=900, control=control)
+            if response.returncode:
+                metrics.incr("fetch_errors")
+                return False
+            metrics.timing("fetch", time.time() - start)
+            return not commit or self._has_commit(commit)
+
+    def bundle(self, commit, control=None):
+        """Create a bundle of the commit's history, it is reused by all the jobs building this commit.
+
+        :param commit: commit hash.
+        :type commit: str
+        :param control: run control of the run waiting for the bundle.
+        :type control: RunControl
+        :return: bundle path or None if it couldn't be created.
+        """
+        bundle_path = os.path.join(BUNDLES_DIR, f"{commit}.bundle")
+        os.makedirs(BUNDLES_DIR, exist_ok=True)
+        # old bundles are removed under the same lock, so a bundle can't be removed while being handed out.
+        with r.lock(BUNDLES_LOCK_KEY, timeout=60, blocking_timeout=60):
+            if os.path.exists(bundle_path):
+                # it is kept for another day from now.
+                os.utime(bundle_path)
+                metrics.incr("bundle_hits")
+                return bundle_path
+            self._remove_old_bundles()
+        ref = f"refs/zeroci/{commit}"
+        tmp_path = f"{bundle_path}.{self.random_string()}"
+        start = time.time()
+        with self._lock(control=control):
+            response = self.execute_cmd(
+                f"git -C {self.path} update-ref {ref} {commit} && git -C {self.path} bundle create {tmp_path} {ref}"
+            )
+            self.execute_cmd(f"git -C {self.path} update-ref -d {ref}")
+        if response.returncode:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            metrics.incr("bundle_errors")
+            return None
+        os.replace(tmp_path, bundle_path)
+        metrics.timing("bundle", time.time() - start)
+        return bundle_path
+
+    def _remove_old_bundles(self):
+        for name in os.listdir(BUNDLES_DIR):
+            path = os.path.join(BUNDLES_DIR, name)
+            try:
+                if time.time() - os.path.getmtime(path) > BUNDLE_EXPIRY:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def prepare(self, commit, control=None):
+        """Make sure the mirror has the commit and return its bundle.
+
+        :param commit: commit hash.
+        :type commit: str
+        :param control: run control of the run, waiting for the mirror stops when the run is stopped.
+        :type control: RunControl
+        :return: bundle path or None if the mirror couldn't be used.
+        """
+        try:
+            if not self.update(commit=commit, control=control):
+                return None
+            return self.bundle(commit=commit, control=control)
+        except Exception:
+            metrics.incr("errors")
+            return None
+
+
+def refresh_mirror(repo):
+    """Fetch the new objects of repo's mirror, it is enqueued on webhook arrival.
+    """
+    RepoMirror(repo).update()
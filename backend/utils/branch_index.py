@@ -0,0 +1,100 @@
+import json
+
+from redis import Redis
+
+from models.trigger_run import TriggerRun
+from packages.vcs.vcs import VCSFactory
+
+BRANCHES_KEY = "zeroci:branches:{repo}"
+# set once a repo's branches are built from the runs' index, so a repo without runs isn't scanned again.
+BUILT_KEY = "zeroci:branches:{repo}:built"
+VCS_BRANCHES_KEY = "zeroci:vcs_branches:{repo}"
+# the webhooks invalidate the cached list, it expires too in case a webhook is missed.
+VCS_BRANCHES_TTL = 3600
+
+r = Redis()
+
+
+class BranchIndex:
+    """Branches of every repo that have runs, with their last run, and the cached branches list of the VCS.
+    """
+
+    def record(self, repo, branch, run_id, status, timestamp):
+        """Record a run of a branch if it isn't older than the last recorded one.
+        """
+        key = BRANCHES_KEY.format(repo=repo)
+        data = r.hget(key, branch)
+        if data:
+            last = json.loads(data)
+            if last["id"] != str(run_id) and last["timestamp"] > timestamp:
+                return
+        r.hset(key, branch, json.dumps({"id": str(run_id), "status": status, "timestamp": timestamp}))
+
+    def forget(self, repo, branch, run_id):
+        """Update a branch's last run when this run is deleted, the branch is removed if it has no more runs.
+        """
+        key = BRANCHES_KEY.format(repo=repo)
+        data = r.hget(key, branch)
+        if not data or json.loads(data)["id"] != str(run_id):
+            return
+        _, runs = TriggerRun.latest(fields=["status", "timestamp"], limit=1, repo=repo, branch=branch)
+        if runs:
+            run = runs[0]
+            r.hset(key, branch, json.dumps({"id": run["id"], "status": run["status"], "timestamp": run["timestamp"]}))
+        else:
+            r.hdel(key, branch)
+
+    def _build(self, repo):
+        branches = {}
+        for branch in TriggerRun.distinct(field="branch", repo=repo):
+            _, runs = TriggerRun.latest(fields=["status", "timestamp"], limit=1, repo=repo, branch=branch)
+            if runs:
+                run = runs[0]
+                branches[branch] = {"id": run["id"], "status": run["status"], "timestamp": run["timestamp"]}
+        pipeline = r.pipeline()
+        if branches:
+            pipeline.hset(BRANCHES_KEY.format(repo=repo), mapping={k: json.dumps(v) for k, v in branches.items()})
+        pipeline.set(BUILT_KEY.format(repo=repo), 1)
+        pipeline.execute()
+        return self.branches(repo)
+
+    def branches(self, repo):
+        """Get the branches that have runs, they are built from the runs' index the first time.
+
+        :return: {branch: {"id", "status", "timestamp"} of the last run}
+        :return type: dict
+        """
+        if not r.exists(BUILT_KEY.format(repo=repo)):
+            return self._build(repo)
+        data = r.hgetall(BRANCHES_KEY.format(repo=repo))
+        return {branch.decode(): json.loads(value) for branch, value in data.items()}
+
+    def vcs_branches(self, repo):
+        """Get the branches that exist on the VCS, they are cached until a push creates or deletes a branch.
+
+        :return: branches names or None if they couldn't be fetched.
+        """
+        key = VCS_BRANCHES_KEY.format(repo=repo)
+        cached = r.get(key)
+        if cached:
+            return json.loads(cached)
+        vcs_obj = VCSFactory().get_cvn(repo=repo)
+        branches = vcs_obj.get_branches()
+        if branches is not None:
+            r.set(key, json.dumps(branches), ex=VCS_BRANCHES_TTL)
+        return branches
+
+    def pushed(self, repo, branch, deleted=False):
+        """Update the cached VCS branches after a push.
+
+        :param deleted: True if the push deleted the branch.
+        :type deleted: bool
+        """
+        key = VCS_BRANCHES_KEY.format(repo=repo)
+        cached = r.get(key)
+        if not cached:
+            return
+        branches = json.loads(cached)
+        if deleted == (branch in branches):
+            # the branch is created or deleted, the list is fetched again on the next request.
+            r.delete(key)
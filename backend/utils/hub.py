@@ -0,0 +1,220 @@
+import time
+
+import gevent
+from gevent.queue import Empty, Full, Queue
+from redis import Redis
+
+from utils.live_logs import LiveLogs
+from utils.log_archive import LogArchive
+from utils.metrics import Metrics
+
+QUEUE_SIZE = 100  # messages waiting for a client before it is disconnected
+BLOCK = 5000  # milliseconds an upstream reader waits before checking its subscribers
+RETRY_INTERVAL = 1  # seconds
+REPORT_INTERVAL = 5  # seconds
+STATUS_CHANNEL = "zeroci_status"
+# messages ending a subscription.
+END = "end"
+ARCHIVED = "archived"
+DROPPED = "dropped"  # the client didn't keep up.
+CLOSED = "closed"  # the client left.
+ENDS = [END, ARCHIVED, DROPPED, CLOSED]
+
+r = Redis()
+metrics = Metrics("hub")
+
+
+class Subscription:
+    """Messages of a topic waiting to be sent to one client.
+
+    The queue is bounded, a client that doesn't keep up is dropped when it gets full instead of slowing down the
+    other clients. `end` has the message that ended the iteration.
+    """
+
+    def __init__(self, hub, topic, since):
+        self.hub = hub
+        self.topic = topic
+        self.since = since
+        self.queue = Queue(maxsize=QUEUE_SIZE)
+        self.end = None
+
+    def put(self, message, timestamp):
+        try:
+            self.queue.put_nowait((timestamp, message))
+        except Full:
+            self.stop(DROPPED)
+            metrics.incr("dropped_clients")
+
+    def __iter__(self):
+        yield from self.topic.reader.history(self.since)
+        while True:
+            timestamp, message = self.queue.get()
+            if message in ENDS:
+                self.end = message
+                return
+            self.hub.lag(time.time() - timestamp)
+            yield message
+
+    def stop(self, reason):
+        """Unsubscribe and end the iteration with this reason, the messages not sent yet are dropped.
+
+        :param reason: `DROPPED` or `CLOSED`.
+        """
+        self.close()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+        self.queue.put_nowait((time.time(), reason))
+
+    def close(self):
+        self.topic.unsubscribe(self)
+
+
+class Topic:
+    """One upstream reader broadcasting to all the subscribers of the process, it stops when they leave.
+
+    The reader has `read(topic)` reading from redis and broadcasting while the topic has subscribers,
+    `history(since)` returning what was broadcasted before subscribing up to `since`, and `position`.
+    """
+
+    def __init__(self, hub, key, reader):
+        self.hub = hub
+        self.key = key
+        self.reader = reader
+        self.subscribers = set()
+        self.greenlet = None
+
+    def subscribe(self):
+        subscription = Subscription(self.hub, self, since=self.reader.position)
+        self.subscribers.add(subscription)
+        if not self.greenlet:
+            self.greenlet = gevent.spawn(self._run)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def broadcast(self, message):
+        timestamp = time.time()
+        for subscription in list(self.subscribers):
+            subscription.put(message, timestamp)
+
+    def _run(self):
+        while self.subscribers:
+            try:
+                self.reader.read(self)
+                break
+            except Exception:
+                metrics.incr("upstream_errors")
+                gevent.sleep(RETRY_INTERVAL)
+        self.hub.remove(self)
+
+
+class LogsReader:
+    """Live logs of a run read from its stream, subscribers get what was read before they came from the stream.
+    """
+
+    def __init__(self, run_id):
+        self.live_logs = LiveLogs(run_id)
+        self.archive = LogArchive(run_id)
+        self.position = "0"
+
+    def history(self, since):
+        chunks = self.live_logs.read_until(since)
+        return [b"".join(chunks)] if chunks else []
+
+    def read(self, topic):
+        while topic.subscribers:
+            self.position, chunks, ended = self.live_logs.read(last_id=self.position, block=BLOCK)
+            if chunks:
+                topic.broadcast(b"".join(chunks))
+            if ended:
+                topic.broadcast(END)
+                return
+            if not chunks and not self.live_logs.exists() and self.archive.exists():
+                # the run finished and its stream expired, subscribers read the rest from the archive.
+                topic.broadcast(ARCHIVED)
+                return
+
+
+class StatusReader:
+    """Runs' status updates published on a redis channel, only the new ones are sent.
+    """
+
+    position = None
+
+    def history(self, since):
+        return []
+
+    def read(self, topic):
+        pubsub = r.pubsub()
+        pubsub.subscribe(STATUS_CHANNEL)
+        try:
+            while topic.subscribers:
+                msg = pubsub.get_message(ignore_subscribe_messages=True, timeout=BLOCK / 1000)
+                if msg and isinstance(msg["data"], bytes):
+                    topic.broadcast(msg["data"])
+        finally:
+            pubsub.close()
+
+
+class Hub:
+    """Fan out of live logs and status updates to the websocket clients of the API process.
+
+    Every run's logs and the status channel have one upstream reader whatever the number of clients, so redis load
+    doesn't grow with the viewers. Subscribers counts and broadcast lag are reported to the `hub` metrics.
+    """
+
+    def __init__(self):
+        self.topics = {}
+        self.reporter = None
+        self._lag_sum = 0
+        self._lag_count = 0
+        self._lag_max = 0
+
+    def _subscribe(self, key, reader_class, **kwargs):
+        topic = self.topics.get(key)
+        if not topic:
+            topic = self.topics[key] = Topic(self, key, reader_class(**kwargs))
+        if not self.reporter:
+            self.reporter = gevent.spawn(self._report)
+        return topic.subscribe()
+
+    def logs(self, run_id):
+        """Subscribe to the live logs of a run.
+
+        :return: subscription to iterate over, it yields the logs written so far then the new ones.
+        """
+        return self._subscribe(("logs", str(run_id)), LogsReader, run_id=run_id)
+
+    def status(self):
+        """Subscribe to the runs' status updates.
+        """
+        return self._subscribe(("status", STATUS_CHANNEL), StatusReader)
+
+    def remove(self, topic):
+        if self.topics.get(topic.key) is topic:
+            del self.topics[topic.key]
+
+    def lag(self, seconds):
+        self._lag_sum += seconds
+        self._lag_count += 1
+        self._lag_max = max(self._lag_max, seconds)
+
+    def _report(self):
+        while True:
+            gevent.sleep(REPORT_INTERVAL)
+            log_topics = [topic for key, topic in self.topics.items() if key[0] == "logs"]
+            status_topic = self.topics.get(("status", STATUS_CHANNEL))
+            metrics.set("log_topics", len(log_topics))
+            metrics.set("log_subscribers", sum(len(topic.subscribers) for topic in log_topics))
+            metrics.set("status_subscribers", len(status_topic.subscribers) if status_topic else 0)
+            if self._lag_count:
+                metrics.set("broadcast_lag_avg", self._lag_sum / self._lag_count)
+                metrics.set("broadcast_lag_max", self._lag_max)
+            self._lag_sum = self._lag_count = self._lag_max = 0
+
+
+hub = Hub()
@@ -0,0 +1,103 @@
+import os
+from xml.parsers import expat
+
+CHUNK_SIZE = 64 * 1024
+MAX_TEXT = int(os.environ.get("JUNIT_MAX_TEXT", 64 * 1024))
+STATUS_MAP = {"error": "errored", "failure": "failed", "skipped": "skipped"}
+
+
+class JUnitReader:
+    """Streaming JUnit xml reader, it reads the file in chunks and emits the testcases one by one.
+
+    Texts of testcases' children (failure bodies, system-out, ...) are truncated to `max_text` characters
+    while reading, so memory doesn't depend on the report size.
+    """
+
+    def __init__(self, max_text=MAX_TEXT, chunk_size=CHUNK_SIZE):
+        self.max_text = max_text
+        self.chunk_size = chunk_size
+
+    def _reset(self):
+        self._events = []
+        self._suite = None
+        self._case = None
+        self._child = None
+        self._depth = 0
+        self._case_depth = None
+
+    def _start(self, tag, attrs):
+        self._depth += 1
+        if tag == "testsuite":
+            self._suite = dict(attrs)
+        elif tag == "testcase":
+            self._case = dict(attrs)
+            self._case_depth = self._depth
+        elif self._case is not None and self._depth == self._case_depth + 1:
+            self._child = {"tag": tag, "attrs": dict(attrs), "text": [], "size": 0, "dropped": 0}
+
+    def _end(self, tag):
+        if self._child and self._depth == self._case_depth + 1:
+            self._end_child()
+        elif tag == "testcase" and self._case is not None:
+            if not self._case.get("status"):
+                self._case["status"] = "passed"
+            self._events.append(("testcase", self._case))
+            self._case = None
+            self._case_depth = None
+        elif tag == "testsuite" and self._suite is not None:
+            self._events.append(("testsuite", self._suite))
+            self._suite = None
+        self._depth -= 1
+
+    def _end_child(self):
+        child = self._child
+        self._child = None
+        text = "".join(child["text"])
+        if child["dropped"]:
+            text += f"\n... truncated {child['dropped']} characters"
+        value = dict(child["attrs"])
+        if text.strip():
+            value["content"] = text
+        if child["tag"] in STATUS_MAP:
+            self._case["status"] = STATUS_MAP[child["tag"]]
+            self._case["details"] = value
+        elif child["attrs"]:
+            self._case[child["tag"]] = value
+        else:
+            self._case[child["tag"]] = text
+
+    def _data(self, data):
+        child = self._child
+        if not child:
+            return
+        left = self.max_text - child["size"]
+        if left <= 0:
+            child["dropped"] += len(data)
+            return
+        if len(data) > left:
+            child["dropped"] += len(data) - left
+            data = data[:left]
+        child["text"].append(data)
+        child["size"] += len(data)
+
+    def iter(self, path):
+        """Read the xml file and yield its events as they are parsed.
+
+        :param path: path to xml file.
+        :type path: str
+        :return: generator of ("testcase", testcase dict) and ("testsuite", testsuite attributes) tuples.
+        """
+        self._reset()
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.CharacterDataHandler = self._data
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                parser.Parse(chunk, not chunk)
+                yield from self._events
+                self._events = []
+                if not chunk:
+                    break
@@ -0,0 +1,62 @@
+import json
+
+from redis import Redis
+
+REPOS_KEY = "zeroci:latest:repos"
+SCHEDULES_KEY = "zeroci:latest:schedules"
+SUCCESS = "success"
+FAILURE = "failure"
+ERROR = "error"
+FINISHED = [SUCCESS, FAILURE, ERROR]
+
+r = Redis()
+
+
+class LatestStatus:
+    """Last finished run of every repo's branch and every schedule, it is what the status badges show.
+
+    Records are kept in redis hashes and updated when a run is reported, cancelled and timed out runs don't change
+    the badge.
+    """
+
+    @staticmethod
+    def _field(repo=None, branch=None, schedule_name=None):
+        if schedule_name:
+            return SCHEDULES_KEY, schedule_name
+        return REPOS_KEY, json.dumps([repo, branch])
+
+    def get(self, repo=None, branch=None, schedule_name=None):
+        """Get the last finished run.
+
+        :return: {"id", "status", "timestamp"} or None if it isn't recorded.
+        """
+        key, field = self._field(repo=repo, branch=branch, schedule_name=schedule_name)
+        data = r.hget(key, field)
+        return json.loads(data) if data else None
+
+    def set(self, run_id, status, timestamp, repo=None, branch=None, schedule_name=None):
+        """Record a finished run if it isn't older than the recorded one.
+        """
+        if status not in FINISHED:
+            return
+        key, field = self._field(repo=repo, branch=branch, schedule_name=schedule_name)
+        latest = self.get(repo=repo, branch=branch, schedule_name=schedule_name)
+        if latest and latest["id"] != str(run_id) and latest["timestamp"] > timestamp:
+            return
+        r.hset(key, field, json.dumps({"id": str(run_id), "status": status, "timestamp": timestamp}))
+
+    def forget(self, run_id, repo=None, branch=None, schedule_name=None):
+        """Delete the record if it is of this run, it is recorded again from the index on the next lookup.
+        """
+        key, field = self._field(repo=repo, branch=branch, schedule_name=schedule_name)
+        latest = self.get(repo=repo, branch=branch, schedule_name=schedule_name)
+        if latest and latest["id"] == str(run_id):
+            r.hdel(key, field)
+
+    def update(self, run_id, model_obj, schedule_name=None):
+        """Record the run of this model object.
+        """
+        if schedule_name:
+            self.set(run_id, model_obj.status, model_obj.timestamp, schedule_name=schedule_name)
+        else:
+            self.set(run_id, model_obj.status, model_obj.timestamp, repo=model_obj.repo, branch=model_obj.branch)
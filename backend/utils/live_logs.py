@@ -0,0 +1,122 @@
+from redis import Redis
+
+STREAM_KEY = "zeroci:logs:{run_id}"
+DATA = b"data"
+END = b"end"
+# runs started before using streams keep their logs in a list ending with this marker.
+LEGACY_END_MARKER = b"hamada ok"
+READ_COUNT = 1000
+
+r = Redis()
+
+
+class LiveLogs:
+    """Live logs of a run in a redis stream, `zeroci:logs:<run_id>`.
+
+    Every entry has a `data` field with a chunk of logs, the run's end is an entry with an `end` field, so readers
+    block on `XREAD` from the last id they read until new chunks or the end arrive. Logs of the runs started before
+    are read from their list.
+
+    Parallel jobs and shards write on `<run_id>:<tag>`, their lines go to the run's stream as they come prefixed with
+    `[<tag>] ` so they can be followed live without being mixed.
+    """
+
+    def __init__(self, log_id, redis=None):
+        self.run_id, _, self.tag = str(log_id).partition(":")
+        self.key = STREAM_KEY.format(run_id=self.run_id)
+        self.redis = redis or r
+
+    def write(self, *chunks, pipeline=None):
+        """Add chunks of logs.
+
+        :param pipeline: redis pipeline to add the chunks with, they are added directly if it isn't sent.
+        """
+        client = pipeline or self.redis.pipeline(transaction=False)
+        for chunk in chunks:
+            if chunk:
+                client.xadd(self.key, {DATA: self._tag_lines(chunk) if self.tag else chunk})
+        if not pipeline:
+            client.execute()
+
+    def _tag_lines(self, content):
+        if isinstance(content, bytes):
+            content = content.decode(errors="replace")
+        tagged = "".join(f"[{self.tag}] {line}" for line in content.splitlines(keepends=True))
+        # the next tagged chunk may come from another job, so it starts on a new line.
+        return tagged if tagged.endswith("\n") else tagged + "\n"
+
+    def end(self):
+        """Mark the end of the run's logs, readers stop after it.
+        """
+        self.redis.xadd(self.key, {END: 1})
+
+    def legacy(self):
+        """Check if the logs are in a list, i.e. the run started before using streams.
+        """
+        return self.redis.type(self.run_id) == b"list"
+
+    def exists(self):
+        return bool(self.redis.exists(self.key)) or self.legacy()
+
+    def read(self, last_id="0", block=None):
+        """Read the chunks added after `last_id`.
+
+        :param block: milliseconds to wait for new chunks, it doesn't wait if it isn't sent.
+        :type block: int
+        :return: (id of the last entry read, chunks, True if the end is reached)
+        """
+        streams = self.redis.xread({self.key: last_id}, count=READ_COUNT, block=block)
+        chunks = []
+        ended = False
+        for _, entries in streams:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                if END in fields:
+                    ended = True
+                    break
+                chunks.append(fields[DATA])
+        return last_id, chunks, ended
+
+    def read_until(self, last_id):
+        """Read the chunks added up to `last_id`, it is included.
+        """
+        if last_id == "0":
+            return []
+        return [fields[DATA] for _, fields in self.redis.xrange(self.key, max=last_id) if DATA in fields]
+
+    def read_all(self):
+        """Read all the logs added so far.
+
+        :return: (logs, True if the end is reached)
+        :return type: tuple
+        """
+        if self.legacy():
+            chunks = self.redis.lrange(self.run_id, 0, -1)
+            ended = bool(chunks) and chunks[-1] == LEGACY_END_MARKER
+            return b"".join(chunks[:-1] if ended else chunks), ended
+        chunks = []
+        ended = False
+        for _, fields in self.redis.xrange(self.key):
+            if END in fields:
+                ended = True
+                break
+            chunks.append(fields[DATA])
+        return b"".join(chunks), ended
+
+    def keys(self):
+        """Get the redis keys that may hold the logs.
+        """
+        keys = [self.key, self.run_id]
+        if self.tag:
+            # parallel jobs and shards had their own stream before their lines went to the run's stream.
+            keys.append(f"{self.key}:{self.tag}")
+        return keys
+
+    def expire(self, seconds):
+        pipeline = self.redis.pipeline()
+        for key in self.keys():
+            pipeline.expire(key, seconds)
+        pipeline.execute()
+
+    def delete(self):
+        self.redis.delete(*self.keys())
@@ -0,0 +1,181 @@
+import json
+import os
+import shutil
+import zlib
+
+from redis import Redis
+
+from utils.live_logs import LiveLogs
+from utils.metrics import Metrics
+
+LOGS_DIR = "/zeroci/logs"
+SEGMENT_SIZE = 256 * 1024  # bytes of raw logs
+# logs are kept in redis for a while after archiving them, so viewers still reading them can finish.
+KEY_TTL = 60
+
+r = Redis()
+metrics = Metrics("log_archive")
+
+
+class LogArchive:
+    """Logs of a finished run compressed in segments on local disk, `/zeroci/logs/<run_id>/<name>.gz`.
+
+    Every segment is a separate zlib stream of about `SEGMENT_SIZE` bytes ending at a line end when possible, and
+    `<name>.index.json` has their offsets, so a range of bytes or lines is read by decompressing only the segments
+    it overlaps. Neph logs of the run are archived with it and listed in `neph.json`.
+    """
+
+    def __init__(self, run_id):
+        self.run_id = str(run_id)
+        self.path = os.path.join(LOGS_DIR, self.run_id)
+
+    def _data_path(self, name):
+        return os.path.join(self.path, f"{name}.gz")
+
+    def _index_path(self, name):
+        return os.path.join(self.path, f"{name}.index.json")
+
+    def _write_json(self, path, data):
+        """Write a json file atomically, readers never see it half written.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path, default=None):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
+    def exists(self, name="log"):
+        return os.path.exists(self._index_path(name))
+
+    def write(self, content, name="log"):
+        """Compress logs in segments.
+
+        :param content: raw logs.
+        :type content: bytes
+        """
+        os.makedirs(self.path, exist_ok=True)
+        segments = []
+        offset = line = compressed_offset = 0
+        tmp_path = f"{self._data_path(name)}.tmp"
+        with open(tmp_path, "wb") as f:
+            while offset < len(content):
+                end = min(offset + SEGMENT_SIZE, len(content))
+                if end < len(content):
+                    line_end = content.rfind(b"\n", offset, end)
+                    if line_end != -1:
+                        end = line_end + 1
+                raw = content[offset:end]
+                compressed = zlib.compress(raw)
+                f.write(compressed)
+                lines = raw.count(b"\n")
+                segments.append(
+                    {
+                        "offset": offset,
+                        "length": len(raw),
+                        "line": line,
+                        "lines": lines,
+                        "compressed_offset": compressed_offset,
+                        "compressed_length": len(compressed),
+                    }
+                )
+                offset = end
+                line += lines
+                compressed_offset += len(compressed)
+        os.replace(tmp_path, self._data_path(name))
+        index = {"size": len(content), "lines": line + (1 if content and not content.endswith(b"\n") else 0)}
+        index["segments"] = segments
+        self._write_json(self._index_path(name), index)
+        metrics.incr("raw_bytes", len(content))
+        metrics.incr("compressed_bytes", compressed_offset)
+
+    def index(self, name="log"):
+        """Get the size, lines count and segments of the archived logs.
+
+        :return: index or None if the logs aren't archived.
+        """
+        return self._read_json(self._index_path(name))
+
+    def _read_segments(self, segments, name):
+        with open(self._data_path(name), "rb") as f:
+            for segment in segments:
+                f.seek(segment["compressed_offset"])
+                yield segment, zlib.decompress(f.read(segment["compressed_length"]))
+
+    def read(self, offset=0, length=None, name="log"):
+        """Read a range of bytes of the archived logs.
+
+        :return: bytes or None if the logs aren't archived.
+        """
+        index = self.index(name)
+        if index is None:
+            return None
+        end = index["size"] if length is None else min(offset + length, index["size"])
+        segments = [s for s in index["segments"] if s["offset"] < end and s["offset"] + s["length"] > offset]
+        if not segments:
+            return b""
+        data = b"".join(raw for _, raw in self._read_segments(segments, name))
+        start = offset - segments[0]["offset"]
+        return data[start : start + end - offset]
+
+    def read_lines(self, line=0, count=None, name="log"):
+        """Read a range of lines of the archived logs.
+
+        :return: bytes or None if the logs aren't archived.
+        """
+        index = self.index(name)
+        if index is None:
+            return None
+        end = index["lines"] if count is None else line + count
+        # the last segment may end without a line end, its last line is counted with it.
+        segments = [s for s in index["segments"] if s["line"] < end and s["line"] + s["lines"] >= line]
+        if not segments:
+            return b""
+        data = b"".join(raw for _, raw in self._read_segments(segments, name))
+        lines = data.splitlines(keepends=True)
+        start = line - segments[0]["line"]
+        return b"".join(lines[start : start + end - line])
+
+    def iter_segments(self, name="log"):
+        """Iterate over the decompressed segments of the archived logs.
+        """
+        index = self.index(name)
+        if index is None:
+            return
+        for _, raw in self._read_segments(index["segments"], name):
+            yield raw
+
+    def neph_keys(self):
+        """Get the archived neph logs keys.
+        """
+        return self._read_json(os.path.join(self.path, "neph.json"), default={})
+
+    def archive(self):
+        """Move the run's logs and its neph logs from redis to the archive.
+        """
+        live_logs = LiveLogs(self.run_id)
+        logs, _ = live_logs.read_all()
+        self.write(logs)
+        neph = {}
+        for number, key in enumerate(r.scan_iter(match=f"neph:{self.run_id}:*", count=1000)):
+            name = f"neph_{number}"
+            content = "".join(json.loads(data)["content"] for data in r.lrange(key, 0, -1))
+            self.write(content.encode(), name=name)
+            neph[key.decode()] = name
+        if neph:
+            self._write_json(os.path.join(self.path, "neph.json"), neph)
+        live_logs.expire(KEY_TTL)
+        pipeline = r.pipeline()
+        for key in neph:
+            pipeline.expire(key, KEY_TTL)
+        pipeline.execute()
+
+    def clear(self):
+        """Delete the archived logs of the run.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
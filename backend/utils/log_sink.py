@@ -0,0 +1,85 @@
+import time
+
+import redis
+
+from utils.live_logs import LiveLogs
+from utils.metrics import Metrics
+
+FLUSH_SIZE = 64 * 1024  # bytes
+FLUSH_INTERVAL = 0.1  # seconds
+
+pool = redis.ConnectionPool()
+metrics = Metrics("log_sink")
+
+
+class LogSink:
+    """Buffer the live logs of a run and add them to its redis stream in batches.
+
+    Chunks are flushed when the buffer reaches `flush_size` bytes or when the oldest buffered chunk
+    becomes older than `flush_interval` seconds, the caller should call `flush` at the end of every step.
+    """
+
+    def __init__(self, key, verbose=True, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.key = key
+        self.verbose = verbose
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.redis = redis.Redis(connection_pool=pool)
+        self.live_logs = LiveLogs(key, redis=self.redis)
+        self._chunks = []
+        self._size = 0
+        self._first_write = None
+
+    def write(self, content):
+        if not (self.verbose and content):
+            return
+        if not self._chunks:
+            self._first_write = time.time()
+        self._chunks.append(content)
+        self._size += len(content.encode())
+        if self._size >= self.flush_size or self.time_to_flush() == 0:
+            self.flush(lines_only=True)
+
+    def time_to_flush(self):
+        """Seconds left before the buffered chunks should be flushed.
+
+        :return: None if there is nothing buffered.
+        :return type: float
+        """
+        if not self._chunks:
+            return None
+        return max(0, self._first_write + self.flush_interval - time.time())
+
+    def flush_if_due(self):
+        if self.time_to_flush() == 0:
+            self.flush(lines_only=True)
+
+    def flush(self, lines_only=False):
+        """Push the buffered chunks.
+
+        :param lines_only: keep the last line in the buffer if it isn't complete, it is used for tagged logs so
+        lines of parallel jobs aren't mixed. The buffer is pushed whole once it reaches `flush_size`.
+        :type lines_only: bool
+        """
+        if not self._chunks:
+            return
+        content = "".join(self._chunks)
+        rest = ""
+        if lines_only and self.live_logs.tag and self._size < self.flush_size:
+            end = content.rfind("\n") + 1
+            content, rest = content[:end], content[end:]
+            if not content:
+                self._first_write = time.time()
+                return
+        size = self._size - len(rest.encode())
+        pipe = self.redis.pipeline(transaction=False)
+        self.live_logs.write(content, pipeline=pipe)
+        pipe.hincrbyfloat(metrics.key, "bytes", size)
+        pipe.hincrbyfloat(metrics.key, "chunks", len(self._chunks))
+        pipe.hincrbyfloat(metrics.key, "flushes", 1)
+        pipe.hset(metrics.key, "last_batch_bytes", size)
+        pipe.hset(metrics.key, "last_batch_chunks", len(self._chunks))
+        pipe.execute()
+        self._chunks = [rest] if rest else []
+        self._size = len(rest.encode())
+        self._first_write = time.time() if rest else None
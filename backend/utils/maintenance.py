@@ -0,0 +1,7 @@
+from redis import Redis
+from rq import Queue
+
+MAINTENANCE_QUEUE = "maintenance"
+
+# background jobs that shouldn't take the runs' workers or die with a run's work horse have their own worker.
+maintenance_queue = Queue(MAINTENANCE_QUEUE, connection=Redis())
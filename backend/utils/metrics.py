@@ -0,0 +1,75 @@
+from redis import Redis
+
+r = Redis()
+METRICS_KEY = "zeroci:metrics:{group}"
+
+
+class Metrics:
+    """Counters and timings shared between the server and all the workers through redis.
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self.key = METRICS_KEY.format(group=group)
+
+    def incr(self, name, amount=1):
+        """Increase a counter.
+
+        :param name: counter's name.
+        :type name: str
+        :param amount: value to be added to the counter.
+        :type amount: int or float
+        """
+        try:
+            r.hincrbyfloat(self.key, name, amount)
+        except Exception:
+            # metrics shouldn't break a run.
+            pass
+
+    def timing(self, name, seconds):
+        """Record a duration, it is stored as count, sum and last value so the average can be calculated.
+
+        :param name: timing's name.
+        :type name: str
+        :param seconds: time taken in seconds.
+        :type seconds: float
+        """
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.hincrbyfloat(self.key, f"{name}_count", 1)
+            pipe.hincrbyfloat(self.key, f"{name}_sum", seconds)
+            pipe.hset(self.key, f"{name}_last", seconds)
+            pipe.execute()
+        except Exception:
+            pass
+
+    def set(self, name, value):
+        """Set a gauge value.
+
+        :param name: gauge's name.
+        :type name: str
+        :param value: current value.
+        :type value: int or float
+        """
+        try:
+            r.hset(self.key, name, value)
+        except Exception:
+            pass
+
+    def get(self):
+        values = r.hgetall(self.key)
+        return {key.decode(): float(value) for key, value in values.items()}
+
+    @classmethod
+    def all(cls):
+        """Return all metrics groups.
+
+        :return: {group: {name: value}}
+        :return type: dict
+        """
+        result = {}
+        prefix = METRICS_KEY.format(group="")
+        for key in r.scan_iter(f"{prefix}*"):
+            group = key.decode()[len(prefix) :]
+            result[group] = cls(group).get()
+        return result
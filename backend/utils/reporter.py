@@ -6,10 +6,16 @@ from redis import Redis
 from models.initial_config import InitialConfig
 from packages.telegram.telegram import Telegram
 from packages.vcs.vcs import VCSFactory
+from utils.branch_index import BranchIndex
+from utils.latest_status import LatestStatus
 
 r = Redis()
 SUCCESS = "success"
 FAILURE = "failure"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+# version control systems only accept error, failure, pending and success.
+VCS_STATUS = {CANCELLED: "error", TIMEOUT: "error"}
 
 
 class Reporter:
@@ -23,6 +29,7 @@ class Reporter:
         :param schedule_name: it will have a value if the run is scheduled.
         :param schedule_name: str
         """
+        LatestStatus().update(run_id=run_id, model_obj=model_obj, schedule_name=schedule_name)
         configs = InitialConfig()
         telegram = Telegram()
         bin_release = model_obj.bin_release
@@ -48,8 +55,16 @@ class Reporter:
                 "id": run_id,
             }
             r.publish("zeroci_status", json.dumps(data))
+            BranchIndex().record(
+                repo=model_obj.repo,
+                branch=model_obj.branch,
+                run_id=run_id,
+                status=model_obj.status,
+                timestamp=model_obj.timestamp,
+            )
             vcs_obj = VCSFactory().get_cvn(repo=model_obj.repo)
-            vcs_obj.status_send(status=model_obj.status, link=link, commit=model_obj.commit)
+            vcs_status = VCS_STATUS.get(model_obj.status, model_obj.status)
+            vcs_obj.status_send(status=vcs_status, link=link, commit=model_obj.commit)
             telegram.send_msg(
                 msg=msg,
                 link=link,
@@ -89,6 +104,10 @@ class Reporter:
             msg = f"✅ {name} passed "
         elif status == FAILURE:
             msg = f"❌ {name} failed "
+        elif status == CANCELLED:
+            msg = f"🚫 {name} cancelled "
+        elif status == TIMEOUT:
+            msg = f"⏱ {name} timed out "
         else:
             msg = f"⛔️ {name} errored "
 
@@ -0,0 +1,77 @@
+import time
+
+from redis import Redis
+
+CANCEL_KEY = "zeroci:cancel:{run_id}"
+RQ_JOB_KEY = "zeroci:rq_job:{run_id}"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+CHECK_INTERVAL = 1
+KEY_TTL = 24 * 3600
+
+r = Redis()
+
+
+class RunControl:
+    """Cancellation and wall-clock timeout of a run or one of its jobs, running commands check it to stop early.
+
+    A job's control is created from the run's one with `job()`, so it stops when the run is cancelled or timed out.
+    """
+
+    def __init__(self, run_id, timeout=None, parent=None):
+        self.run_id = run_id
+        self.timeout = timeout
+        self.deadline = time.time() + timeout if timeout else None
+        self.parent = parent
+        self.reason = None
+        self.message = ""
+        self._checked = 0
+
+    def job(self, timeout=None):
+        """Create the control of a job of this run.
+
+        :param timeout: job's timeout in seconds.
+        :type timeout: int
+        """
+        return RunControl(run_id=self.run_id, timeout=timeout, parent=self)
+
+    @staticmethod
+    def cancel(run_id):
+        """Ask the run to stop, its running commands stop within a few seconds.
+        """
+        r.set(CANCEL_KEY.format(run_id=run_id), 1, ex=KEY_TTL)
+
+    @staticmethod
+    def set_rq_job(run_id, job_id):
+        r.set(RQ_JOB_KEY.format(run_id=run_id), job_id, ex=KEY_TTL)
+
+    @staticmethod
+    def get_rq_job(run_id):
+        job_id = r.get(RQ_JOB_KEY.format(run_id=run_id))
+        return job_id.decode() if job_id else None
+
+    @staticmethod
+    def clear(run_id):
+        r.delete(CANCEL_KEY.format(run_id=run_id), RQ_JOB_KEY.format(run_id=run_id))
+
+    def _stop(self, reason, message):
+        self.reason = reason
+        self.message = message
+        return reason
+
+    def check(self):
+        """Check if the run or the job should stop.
+
+        :return: None, `cancelled` or `timeout`.
+        """
+        if self.reason:
+            return self.reason
+        if self.parent and self.parent.check():
+            return self._stop(self.parent.reason, self.parent.message)
+        if self.deadline and time.time() > self.deadline:
+            return self._stop(TIMEOUT, f"Timeout exceeded {self.timeout} seconds")
+        if not self.parent and time.time() - self._checked >= CHECK_INTERVAL:
+            self._checked = time.time()
+            if r.exists(CANCEL_KEY.format(run_id=self.run_id)):
+                return self._stop(CANCELLED, "Run has been cancelled")
+        return None
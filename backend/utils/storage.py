@@ -0,0 +1,125 @@
+import os
+
+from redis import Redis
+
+from models.run_result import RunResult
+from utils.live_logs import LiveLogs
+from utils.log_archive import LogArchive
+
+RUNS_KEY = "zeroci:storage:runs"
+TOTAL_KEY = "zeroci:storage:total"
+NEPH_KEYS = "zeroci:storage:neph:{run_id}"
+BIN_DIR = "/zeroci/bin/"
+# runs' documents are kept in the whoosh store, legacy runs have their results there too.
+STORE_PATH = "/root/.config/jumpscale/whoosh_indexes/"
+
+r = Redis()
+
+
+def bin_path(run):
+    """Get the local path of a run's bin release.
+
+    :param run: run object or its index summary, it needs `bin_release` and `schedule_name` or `repo` and `branch`.
+    :return: path or None if the run has no bin release.
+    """
+    get = run.get if isinstance(run, dict) else lambda field: getattr(run, field, None)
+    bin_release = get("bin_release")
+    if not bin_release:
+        return None
+    if get("schedule_name"):
+        return os.path.join(BIN_DIR, get("schedule_name"), bin_release)
+    return os.path.join(BIN_DIR, get("repo"), get("branch"), bin_release)
+
+
+def record_neph_keys(run_id, *keys):
+    """Record the neph keys of a run when they are found, so they are counted and deleted with it.
+    """
+    if keys:
+        r.sadd(NEPH_KEYS.format(run_id=run_id), *keys)
+
+
+def run_keys(run_id):
+    """Get the redis keys holding a run's logs.
+    """
+    neph_keys = NEPH_KEYS.format(run_id=run_id)
+    keys = LiveLogs(run_id).keys() + [neph_keys]
+    keys.extend(key.decode() for key in r.smembers(neph_keys))
+    return keys
+
+
+def dir_size(path):
+    size = 0
+    if os.path.isdir(path):
+        for entry in os.scandir(path):
+            if entry.is_file():
+                size += entry.stat().st_size
+    return size
+
+
+def tree_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+class Storage:
+    """Space used by every run's results, logs and bin release, it is counted once when the run finishes.
+
+    The documents store isn't split by run, it is measured as a whole by `store_size`.
+    """
+
+    def run_size(self, run_id, run):
+        size = dir_size(RunResult(run_id).path) + dir_size(LogArchive(run_id).path)
+        for key in run_keys(run_id):
+            # archived logs are deleted from redis soon.
+            if r.ttl(key) == -1:
+                size += r.memory_usage(key) or 0
+        path = bin_path(run)
+        if path and os.path.isfile(path):
+            size += os.path.getsize(path)
+        return size
+
+    def account(self, run_id, run):
+        """Count the space used by a run, replacing its previous count if it was counted before.
+        """
+        size = self.run_size(run_id, run)
+        old = int(r.hget(RUNS_KEY, run_id) or 0)
+        pipeline = r.pipeline()
+        pipeline.hset(RUNS_KEY, run_id, size)
+        pipeline.incrby(TOTAL_KEY, size - old)
+        pipeline.execute()
+
+    def release(self, run_id):
+        """Stop counting a run, e.g. when it is deleted or rebuilt.
+        """
+        old = int(r.hget(RUNS_KEY, run_id) or 0)
+        pipeline = r.pipeline()
+        pipeline.hdel(RUNS_KEY, run_id)
+        pipeline.decrby(TOTAL_KEY, old)
+        pipeline.execute()
+
+    def store_size(self):
+        """Get the size of the runs' documents store, it has a few segment files whatever the number of runs.
+        """
+        return tree_size(STORE_PATH)
+
+    def total(self):
+        """Get the space used by all runs in bytes, or None if it was never counted.
+        """
+        total = r.get(TOTAL_KEY)
+        return int(total) if total is not None else None
+
+    def recount(self, factories):
+        """Count the space used by all the runs of the factories from scratch.
+        """
+        r.delete(RUNS_KEY, TOTAL_KEY)
+        r.set(TOTAL_KEY, 0)
+        for factory in factories:
+            for _, name, summary in factory._model.scan():
+                self.account(name.strip("model"), summary)
+        return self.total()
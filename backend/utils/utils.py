@@ -4,22 +4,43 @@ import time
 from subprocess import PIPE, CompletedProcess, Popen, TimeoutExpired
 from uuid import uuid4
 
-import xmltodict
+from utils.junit import MAX_TEXT, JUnitReader
 
 ansi_escape = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
 
 
+CONTROL_INTERVAL = 1  # seconds
+
+
 class Utils:
-    def execute_cmd(self, cmd, timeout=3600):
+    def execute_cmd(self, cmd, timeout=3600, control=None):
+        """Execute a command locally.
+
+        :param control: run control of the caller, the command is killed once it stops the run.
+        :type control: RunControl
+        """
+        start = time.time()
         with Popen(cmd, shell=True, universal_newlines=True, stdout=PIPE, stderr=PIPE, encoding="utf-8") as process:
-            try:
-                stdout, stderr = process.communicate(timeout=timeout)
-                retruncode = process.poll()
-            except TimeoutExpired:
-                process.kill()
-                stdout = "Error Timeout Exceeded {}".format(timeout)
-                stderr = ""
-                retruncode = 127
+            while True:
+                wait = timeout - (time.time() - start)
+                if control:
+                    wait = min(wait, CONTROL_INTERVAL)
+                try:
+                    stdout, stderr = process.communicate(timeout=max(wait, 0))
+                    retruncode = process.poll()
+                    break
+                except TimeoutExpired:
+                    if control and control.check():
+                        stdout = control.message
+                    elif time.time() - start < timeout:
+                        continue
+                    else:
+                        stdout = "Error Timeout Exceeded {}".format(timeout)
+                    process.kill()
+                    process.communicate()
+                    stderr = ""
+                    retruncode = 127
+                    break
 
         return CompletedProcess(process.args, returncode=retruncode, stdout=stdout, stderr=stderr)
 
@@ -46,45 +67,82 @@ class Utils:
         with open(file_path, append_write) as f:
             f.write(text)
 
-    def xml_parse(self, path, line):
-        """Parse the xml file resulted from junit.
+    def xml_parse(self, path, line, max_text=None):
+        """Parse the xml file resulted from junit, the file is streamed so huge reports don't load in memory.
 
         :param path: path to xml file.
         :type path: str
         :param line: command line of the execution to check if it result from pytest as there is a different naming for skip tests between pytest and nosetest.
         :param line: str
+        :param max_text: maximum length of every testcase's output or failure details, longer ones are truncated.
+        :type max_text: int
         """
         result = dict(summary={}, testcases=[])
-        content = xmltodict.parse(self.load_file(path), attr_prefix="", cdata_key="content")["testsuite"]
-        result["summary"]["name"] = content["name"]
         if "pytest" in line:
-            result_list = ["tests", "errors", "failures", "skipped"]
+            skip_keys = ["skipped", "skip"]
         else:
-            result_list = ["tests", "errors", "failures", "skip"]
-
-        for key in result_list:
-            if key == "skipped":
-                result["summary"]["skip"] = int(content[key])
-            else:
-                result["summary"][key] = int(content[key])
-        # this check for one test case in xml file
-        if not isinstance(content["testcase"], list):
-            content["testcase"] = [content["testcase"]]
-
-        status_map = {"error": "errored", "failure": "failed", "skipped": "skipped"}
-        for testcase in content["testcase"]:
-            obj = dict()
-            for key in testcase.keys():
-                if key in status_map:
-                    obj["status"] = status_map[key]
-                    obj["details"] = dict(testcase[key])
-                else:
-                    obj[key] = testcase[key]
-
-            if not obj.get("status"):
-                obj["status"] = "passed"
-
-            result["testcases"].append(obj)
+            skip_keys = ["skip", "skipped"]
+        reader = JUnitReader(max_text=max_text or MAX_TEXT)
+        names = []
+        summary = {"tests": 0, "errors": 0, "failures": 0, "skip": 0}
+        counted = dict(summary)
+        status_keys = {"errored": "errors", "failed": "failures", "skipped": "skip"}
+        for event, data in reader.iter(path):
+            if event == "testcase":
+                result["testcases"].append(data)
+                counted["tests"] += 1
+                if data["status"] in status_keys:
+                    counted[status_keys[data["status"]]] += 1
+                continue
+
+            # testsuite is finished, some junit generators don't write all the counters.
+            names.append(data.get("name", ""))
+            values = {"tests": data.get("tests"), "errors": data.get("errors"), "failures": data.get("failures")}
+            values["skip"] = next((data[key] for key in skip_keys if data.get(key) is not None), None)
+            for key, value in values.items():
+                summary[key] += int(value) if value is not None else counted[key]
+            counted = dict.fromkeys(counted, 0)
+
+        if not names:
+            raise ValueError(f"{path} doesn't contain any testsuite")
+        result["summary"]["name"] = ", ".join(names)
+        result["summary"].update(summary)
+        return result
+
+    def split_tests(self, tests, durations, shards):
+        """Split tests over shards so every shard takes about the same time, the longest tests are placed first.
+
+        :param tests: ids of all the tests, every one of them is placed in a shard.
+        :type tests: list
+        :param durations: {test id: duration in seconds} of the known tests, new tests take their average.
+        :type durations: dict
+        :param shards: number of shards.
+        :type shards: int
+        :return: list of test ids for every shard.
+        :return type: list
+        """
+        known = [durations[test_id] for test_id in tests if test_id in durations]
+        default = sum(known) / len(known) if known else 1
+        tests_durations = {test_id: durations.get(test_id, default) for test_id in tests}
+        shards_tests = [[] for _ in range(shards)]
+        loads = [0] * shards
+        for test_id, duration in sorted(tests_durations.items(), key=lambda item: item[1], reverse=True):
+            index = loads.index(min(loads))
+            shards_tests[index].append(test_id)
+            loads[index] += duration
+        return shards_tests
+
+    def merge_testsuites(self, testsuites):
+        """Merge the parsed xml results of shards into one testsuite.
+
+        :param testsuites: results of xml_parse.
+        :type testsuites: list
+        """
+        result = dict(summary={"name": testsuites[0]["summary"]["name"]}, testcases=[])
+        for key in ["tests", "errors", "failures", "skip"]:
+            result["summary"][key] = sum(testsuite["summary"][key] for testsuite in testsuites)
+        for testsuite in testsuites:
+            result["testcases"].extend(testsuite["testcases"])
         return result
 
     def load_file(self, path):
@@ -1,11 +1,16 @@
 import os
+import sys
 
 from redis import Redis
 from rq import Worker, Queue, Connection
 
-listen = ["default"]
+from deployment import kube
+
+# queues are passed as arguments, e.g. `maintenance` for the maintenance worker.
+listen = sys.argv[1:] or ["default"]
 
 if __name__ == "__main__":
+    kube.preload()
     with Connection(Redis()):
         worker = Worker(list(map(Queue, listen)))
         worker.work()
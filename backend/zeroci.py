@@ -7,6 +7,7 @@ from gevent.pywsgi import WSGIServer
 from apis.base import app
 import apis.config
 import apis.login
+import apis.metrics
 import apis.results
 import apis.schedule
 import apis.trigger
@@ -14,9 +15,13 @@ import apis.websockets
 import apis.default
 from beaker.middleware import SessionMiddleware
 from geventwebsocket.handler import WebSocketHandler
+from models.scheduler_run import SchedulerRun
+from models.trigger_run import TriggerRun
 
 session_opts = {"session.type": "file", "session.data_dir": "./data", "session.auto": True}
 app_with_session = SessionMiddleware(app, session_opts)
 if __name__ == "__main__":
+    TriggerRun.ensure_index()
+    SchedulerRun.ensure_index()
     server = WSGIServer(("0.0.0.0", 6010), app_with_session, handler_class=WebSocketHandler)
     server.serve_forever()
@@ -32,8 +32,8 @@ export default {
     getBranches(repoName) {
         return apiClient.get('/repos/' + repoName)
     },
-    getBranchDetails(orgName, branch) {
-        return apiClient.get('/repos/' + orgName + '?branch=' + branch)
+    getBranchDetails(orgName, branch, limit, cursor) {
+        return apiClient.get('/repos/' + orgName, { params: { branch: branch, limit: limit, cursor: cursor } })
     },
     restartBuild(repo, branch) {
         return apiClient.post('/run_trigger', { repo: repo, branch: branch })
@@ -41,6 +41,9 @@ export default {
     restartBuildId(id) {
         return apiClient.post('/run_trigger', { id: id })
     },
+    cancelRun(id) {
+        return apiClient.post('/cancel', { id: id })
+    },
     runConfig(orgName) {
         return apiClient.get('/run_config/' + orgName);
     },
@@ -58,8 +61,8 @@ export default {
     rebuildJob(name) {
         return apiClient.post('/schedule_trigger', { schedule_name: name })
     },
-    getSchedulesDetails(scheduleName) {
-        return apiClient.get('/schedules/' + scheduleName)
+    getSchedulesDetails(scheduleName, limit, cursor) {
+        return apiClient.get('/schedules/' + scheduleName, { params: { limit: limit, cursor: cursor } })
     },
     getProjectIdDetails(scheduleName, id) {
         return apiClient.get('/schedules/' + scheduleName + '?id=' + id)
@@ -5,6 +5,14 @@ fi
 if [ ! -z "$REDIS" ] ; then
   echo "REDIS=$REDIS" >> /etc/environment
 fi
+for var in WARM_POOL_IMAGES WARM_POOL_IDLE WARM_POOL_MAX CACHE_SIZE \
+  IMAGE_REGISTRY IMAGE_CACHE_TTL IMAGE_CACHE_NEGATIVE_TTL IMAGE_VALIDATION_OFFLINE KUBE_POOL_SIZE \
+  ADMISSION_TIMEOUT ADMISSION_DISABLED ZEROCI_OWNER KUBERNETES_SERVICE_HOST KUBERNETES_SERVICE_PORT \
+  STORAGE_BUDGET; do
+  if [ ! -z "${!var}" ] ; then
+    echo "$var=${!var}" >> /etc/environment
+  fi
+done
 mkdir /zeroci/xml
 mkdir -p /root/.config/jumpscale/
 cd /sandbox/code/github/threefoldtech/zeroCI/install/config
@@ -14,6 +22,7 @@ cp jsng_config.toml /root/.config/jumpscale/config.toml
 cd /sandbox/code/github/threefoldtech/zeroCI/backend
 redis-server /etc/redis/redis.conf
 for i in {1..5}; do cp worker.py worker$i.py; python3 worker$i.py &> worker_$i.log & done
+cp worker.py maintenance_worker.py; python3 maintenance_worker.py maintenance &> maintenance_worker.log &
 rqscheduler &> schedule.log &
 service cron start
 python3 zeroci.py